@@ -1 +0,0 @@
-import base58_tools
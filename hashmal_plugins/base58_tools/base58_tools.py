@@ -1,21 +1,48 @@
 from PyQt4.QtGui import *
 from PyQt4.QtCore import *
 
-from bitcoin import base58
-
 from hashmal_lib.core.utils import is_hex, format_hex_string
 from hashmal_lib.gui_utils import floated_buttons, Separator
 from hashmal_lib.plugins import BaseDock, Plugin, augmenter, Category
 
+import batch
+import codec
+
 def make_plugin():
     return Plugin(Base58Tools)
 
 
+class BatchThread(QThread):
+    """Thread that converts the lines of a file and writes the results to another file."""
+    def __init__(self, in_path, out_path, mode, check, parent=None):
+        super(BatchThread, self).__init__(parent)
+        self.in_path = in_path
+        self.out_path = out_path
+        self.mode = mode
+        self.check = check
+        self.count = 0
+        self.errors = 0
+        self.exception = None
+
+    def run(self):
+        try:
+            with open(self.out_path, 'w') as f:
+                for result in batch.convert_file(self.in_path, self.mode, self.check):
+                    f.write(batch.format_result(result) + '\n')
+                    self.count += 1
+                    if result.error:
+                        self.errors += 1
+        except Exception as e:
+            self.exception = e
+
 class Base58Tools(BaseDock):
     tool_name = 'Base58 Tools'
     description = 'Base58 Tools encodes and decodes base58 data.'
     is_large = False
 
+    def init_data(self):
+        self.batch_thread = None
+
     def create_layout(self):
         self.payload_edit = QPlainTextEdit()
         self.handler.substitute_variables(self.payload_edit)
@@ -36,6 +63,15 @@ class Base58Tools(BaseDock):
         self.decode_button.setWhatsThis('Click this to decode the above base58 data.')
         self.decode_button.clicked.connect(self.decode_data)
 
+        self.check_box = QCheckBox('Base58Check')
+        self.check_box.setWhatsThis('Check this to append a checksum when encoding, and to verify it when decoding.')
+        self.batch_button = QPushButton('Batch...')
+        batch_menu = QMenu(self.batch_button)
+        batch_menu.addAction('Encode File...', lambda: self.convert_file(batch.ENCODE))
+        batch_menu.addAction('Decode File...', lambda: self.convert_file(batch.DECODE))
+        self.batch_button.setMenu(batch_menu)
+        self.batch_button.setWhatsThis('Encode or decode each line of a file, writing the results to another file.')
+
         encode_vbox = QVBoxLayout()
         encode_vbox.addWidget(self.payload_edit)
         encode_vbox.addLayout(floated_buttons([self.encode_button]))
@@ -44,7 +80,13 @@ class Base58Tools(BaseDock):
         decode_vbox.addWidget(self.encoded_edit)
         decode_vbox.addLayout(floated_buttons([self.decode_button]))
 
+        options_hbox = QHBoxLayout()
+        options_hbox.addWidget(self.check_box)
+        options_hbox.addStretch(1)
+        options_hbox.addWidget(self.batch_button)
+
         vbox = QVBoxLayout()
+        vbox.addLayout(options_hbox)
         vbox.addLayout(encode_vbox)
         vbox.addWidget(Separator())
         vbox.addLayout(decode_vbox)
@@ -61,7 +103,7 @@ class Base58Tools(BaseDock):
             payload = format_hex_string(payload, with_prefix=False).decode('hex')
 
         try:
-            msg = base58.encode(payload)
+            msg = codec.encode_check(payload) if self.check_box.isChecked() else codec.encode(payload)
             self.encoded_edit.setPlainText(msg)
         except Exception as e:
             self.error(str(e))
@@ -72,8 +114,30 @@ class Base58Tools(BaseDock):
             self.error('No data was input.')
 
         try:
-            payload = base58.decode(msg)
+            payload = codec.decode_check(msg) if self.check_box.isChecked() else codec.decode(msg)
             self.payload_edit.setPlainText(payload.encode('hex'))
         except Exception as e:
             self.error(str(e))
 
+    def convert_file(self, mode):
+        """Encode or decode the lines of a file in the background."""
+        if self.batch_thread and self.batch_thread.isRunning():
+            self.error('A batch is already running.')
+            return
+        in_path = str(QFileDialog.getOpenFileName(self, 'Input File'))
+        if not in_path:
+            return
+        out_path = str(QFileDialog.getSaveFileName(self, 'Output File'))
+        if not out_path:
+            return
+
+        self.batch_thread = BatchThread(in_path, out_path, mode, self.check_box.isChecked())
+        self.batch_thread.finished.connect(self.batch_finished)
+        self.batch_thread.start()
+
+    def batch_finished(self):
+        thread = self.batch_thread
+        if thread.exception:
+            self.error(str(thread.exception))
+        else:
+            self.info('Converted %d lines (%d errors).' % (thread.count, thread.errors))
@@ -0,0 +1,86 @@
+"""Batch base58 encoding and decoding.
+
+Lines of hex data or base58 are converted on a pool of worker processes,
+with results yielded in the order that the lines were read. Lines are
+read only a few chunks ahead of the results.
+"""
+from binascii import hexlify, unhexlify
+from collections import namedtuple
+
+from hashmal_plugins import workers
+
+import codec
+
+ENCODE = 'encode'
+DECODE = 'decode'
+
+# version is the hex of the first payload byte in Base58Check mode.
+# error is None unless the line could not be converted.
+BatchResult = namedtuple('BatchResult', ('line_num', 'input', 'output', 'version', 'error'))
+
+def convert(data, mode, check=False):
+    """Encode hex data or decode base58.
+
+    If check is True, a Base58Check checksum is appended when encoding and
+    verified when decoding.
+
+    Returns:
+        A tuple of (output, version byte as hex or None).
+    """
+    if mode == ENCODE:
+        if data.startswith('0x'):
+            data = data[2:]
+        payload = unhexlify(data)
+        output = codec.encode_check(payload) if check else codec.encode(payload)
+    elif mode == DECODE:
+        payload = codec.decode_check(data) if check else codec.decode(data)
+        output = hexlify(payload).decode('ascii')
+    else:
+        raise ValueError('Unknown mode: %s' % mode)
+
+    version = hexlify(payload[:1]).decode('ascii') if check and payload else None
+    return output, version
+
+def _convert_line(args):
+    line_num, line, mode, check = args
+    try:
+        output, version = convert(line, mode, check)
+    except Exception as e:
+        return BatchResult(line_num, line, None, None, str(e) or e.__class__.__name__)
+    return BatchResult(line_num, line, output, version, None)
+
+def convert_lines(lines, mode, check=False, processes=None, chunksize=256):
+    """Convert lines of hex data (mode ENCODE) or base58 (mode DECODE).
+
+    Args:
+        lines (iterable): Lines to convert. Blank lines are skipped.
+        mode (str): ENCODE or DECODE.
+        check (bool): Whether to append or verify Base58Check checksums.
+        processes (int): Number of worker processes. If 1, lines are
+            converted in the current process.
+        chunksize (int): Number of lines sent to a worker at a time.
+
+    Yields:
+        A BatchResult for each line that is not blank.
+    """
+    if mode not in [ENCODE, DECODE]:
+        raise ValueError('Unknown mode: %s' % mode)
+    jobs = ((line_num, line.strip(), mode, check) for line_num, line in enumerate(lines, 1) if line.strip())
+    results = workers.imap(_convert_line, jobs, processes, chunksize)
+    try:
+        for result in results:
+            yield result
+    finally:
+        results.close()
+
+def convert_file(path, mode, check=False, processes=None, chunksize=256):
+    """Convert the lines of the file at path. See convert_lines()."""
+    with open(path, 'r') as f:
+        for result in convert_lines(f, mode, check, processes, chunksize):
+            yield result
+
+def format_result(result):
+    """Format a BatchResult as a tab-separated line of input, output and version or error."""
+    if result.error:
+        return '%s\t\terror: %s' % (result.input, result.error)
+    return '\t'.join([result.input, result.output, result.version or ''])
@@ -0,0 +1,45 @@
+"""Benchmark the base58 codec against python-bitcoinlib's.
+
+Usage: python -m hashmal_plugins.base58_tools.benchmark [payload sizes in bytes]
+"""
+import os
+import sys
+import time
+
+from bitcoin import base58
+
+from hashmal_plugins.base58_tools import codec
+
+default_sizes = [32, 1024, 8192, 32768, 65536]
+
+def timed(func, arg):
+    start = time.time()
+    result = func(arg)
+    return result, time.time() - start
+
+def benchmark(sizes=default_sizes):
+    """Time encoding and decoding random payloads of each size.
+
+    Returns a list of (size, bitcoin encode, codec encode, bitcoin decode, codec decode)
+    tuples, with times in seconds.
+    """
+    results = []
+    for size in sizes:
+        payload = os.urandom(size)
+        encoded, old_encode = timed(base58.encode, payload)
+        new_encoded, new_encode = timed(codec.encode, payload)
+        decoded, old_decode = timed(base58.decode, encoded)
+        new_decoded, new_decode = timed(codec.decode, encoded)
+        if new_encoded != encoded or new_decoded != payload or decoded != payload:
+            raise AssertionError('Results differ for a payload of %d bytes' % size)
+        results.append((size, old_encode, new_encode, old_decode, new_decode))
+    return results
+
+def main(args):
+    sizes = [int(i) for i in args] or default_sizes
+    print('%10s %14s %14s %14s %14s' % ('Bytes', 'Encode (old)', 'Encode (new)', 'Decode (old)', 'Decode (new)'))
+    for result in benchmark(sizes):
+        print('%10d %13.4fs %13.4fs %13.4fs %13.4fs' % result)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,141 @@
+"""Base58 encoding and decoding for large payloads.
+
+Converting between bytes and base58 by repeatedly dividing by 58 takes
+time quadratic in the payload length. Here numbers are instead split
+recursively by powers of 58^(2^k), which are computed once and cached.
+Decoding only needs multiplications. Encoding needs divisions by those
+powers, which use recursive (Burnikel-Ziegler) division so that they
+also cost about as much as a multiplication.
+"""
+from binascii import hexlify, unhexlify
+import hashlib
+
+from bitcoin.base58 import Base58ChecksumError, InvalidBase58Error
+
+alphabet = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+alphabet_index = dict((c, i) for i, c in enumerate(alphabet))
+
+# Numbers below this many base58 digits are converted one digit at a time.
+SMALL_DIGITS = 64
+# Divisions of numbers below this many bits use the built-in divmod.
+DIV_LIMIT_BITS = 4000
+
+# {k: 58**k}, where k is a power of two.
+_powers = {1: 58}
+
+def power(k):
+    """Get 58**k, where k is a power of two."""
+    p = _powers.get(k)
+    if p is None:
+        p = power(k // 2) ** 2
+        _powers[k] = p
+    return p
+
+def _div2n1n(a, b, n):
+    """Divide a by b, where b has exactly n bits and a < 2**n * b."""
+    if a.bit_length() - n <= DIV_LIMIT_BITS:
+        return divmod(a, b)
+    pad = n & 1
+    if pad:
+        a <<= 1
+        b <<= 1
+        n += 1
+    half_n = n >> 1
+    mask = (1 << half_n) - 1
+    b1, b2 = b >> half_n, b & mask
+    q1, r = _div3n2n(a >> n, (a >> half_n) & mask, b, b1, b2, half_n)
+    q2, r = _div3n2n(r, a & mask, b, b1, b2, half_n)
+    if pad:
+        r >>= 1
+    return q1 << half_n | q2, r
+
+def _div3n2n(a12, a3, b, b1, b2, n):
+    if a12 >> n == b1:
+        q, r = (1 << n) - 1, a12 - (b1 << n) + b1
+    else:
+        q, r = _div2n1n(a12, b1, n)
+    r = (r << n | a3) - q * b2
+    while r < 0:
+        q -= 1
+        r += b
+    return q, r
+
+def int_to_base58(n, width=0):
+    """Convert a non-negative integer to base58 digits.
+
+    The result is padded with zero digits ('1') to at least width digits.
+    """
+    if n < power(SMALL_DIGITS):
+        digits = []
+        while n:
+            n, r = divmod(n, 58)
+            digits.append(alphabet[r])
+        return ''.join(reversed(digits)).rjust(width, '1')
+
+    # Split at the smallest power 58**k such that n < 58**(2k).
+    k = SMALL_DIGITS
+    while n >= power(2 * k):
+        k *= 2
+    p = power(k)
+    q, r = _div2n1n(n, p, p.bit_length())
+    return int_to_base58(q, max(width - k, 0)) + int_to_base58(r, k)
+
+def base58_to_int(s):
+    """Convert base58 digits to an integer."""
+    if len(s) <= SMALL_DIGITS:
+        n = 0
+        try:
+            for c in s:
+                n = n * 58 + alphabet_index[c]
+        except KeyError:
+            raise InvalidBase58Error('Character %r is not a valid base58 character' % c)
+        return n
+
+    # Split off the largest power of two digits.
+    k = SMALL_DIGITS
+    while 2 * k < len(s):
+        k *= 2
+    return base58_to_int(s[:-k]) * power(k) + base58_to_int(s[-k:])
+
+def encode(data):
+    """Encode bytes as base58."""
+    data = bytes(data)
+    payload = data.lstrip(b'\x00')
+    zeros = len(data) - len(payload)
+    n = int(hexlify(payload), 16) if payload else 0
+    return '1' * zeros + (int_to_base58(n) if n else '')
+
+def decode(s):
+    """Decode base58 to bytes."""
+    s = str(s)
+    digits = s.lstrip('1')
+    zeros = len(s) - len(digits)
+    n = base58_to_int(digits)
+    payload = b''
+    if n:
+        h = '%x' % n
+        if len(h) % 2:
+            h = '0' + h
+        payload = unhexlify(h)
+    return b'\x00' * zeros + payload
+
+def checksum(data):
+    """Get the Base58Check checksum of data."""
+    return hashlib.sha256(hashlib.sha256(data).digest()).digest()[:4]
+
+def encode_check(data):
+    """Encode bytes as base58 with a Base58Check checksum appended."""
+    data = bytes(data)
+    return encode(data + checksum(data))
+
+def decode_check(s):
+    """Decode base58 and verify its Base58Check checksum.
+
+    Returns the data without its checksum.
+    """
+    raw = decode(s)
+    data, check = raw[:-4], raw[-4:]
+    if len(raw) < 4 or checksum(data) != check:
+        raise Base58ChecksumError('Checksum mismatch: expected %s, calculated %s' % (
+            hexlify(check), hexlify(checksum(data))))
+    return data
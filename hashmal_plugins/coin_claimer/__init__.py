@@ -1,2 +1 @@
-import coin_claimer
-from coin_claimer import *
+from claims import get_unsigned_outputs, replace_outputs
@@ -0,0 +1,214 @@
+"""Bulk auditing of transactions for unsigned outputs.
+
+Raw transactions and blocks are read from files and checked with
+get_unsigned_outputs() on a pool of worker processes. Files may contain
+hex-encoded transactions or blocks, one per line, or binary data: a
+single transaction or block, consecutive transactions, or blocks framed
+as in blk*.dat files.
+"""
+from collections import namedtuple
+import itertools
+import os
+import string
+import struct
+
+from bitcoin.core import b2lx, x, CBlock
+from bitcoin.core.serialize import VarIntSerializer
+
+from hashmal_lib.core import chainparams
+from hashmal_lib.core.transaction import Transaction
+
+from hashmal_plugins import workers
+
+from claims import get_unsigned_outputs
+
+# error is None unless the item could not be deserialized.
+AuditResult = namedtuple('AuditResult', ('source', 'txid', 'num_outputs', 'unsigned_outputs', 'error'))
+
+# Kinds of items read from files.
+HEX_ITEM = 'hex'
+RAW_ITEM = 'raw'
+# Data that could not be split into items. The item's data is the error message.
+INVALID_ITEM = 'invalid'
+
+# Files made up of these characters are read as hex lines.
+_text_chars = set(string.printable)
+
+# Blocks in blk*.dat files are each preceded by network magic bytes and their size.
+_block_frame = struct.Struct(b'<4sI')
+# Size of a block header, which is also the minimum size of a serialized block.
+_min_block_size = 80
+
+def iter_files(path):
+    """Yield path, or the files under path if it is a directory."""
+    if not os.path.isdir(path):
+        yield path
+        return
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            yield os.path.join(root, name)
+
+def is_block_file(f):
+    """Check whether f holds blocks framed as in blk*.dat files."""
+    header = f.read(_block_frame.size)
+    try:
+        if len(header) < _block_frame.size:
+            return False
+        magic, size = _block_frame.unpack(header)
+        end = _block_frame.size + size
+        if size < _min_block_size or end > os.fstat(f.fileno()).st_size:
+            return False
+        f.seek(end)
+        # The block is followed by another block, preallocated zeroes or the end of the file.
+        return f.read(4) in [magic, b'\x00'*4, b'']
+    finally:
+        f.seek(0)
+
+def read_block_file(filename, f):
+    """Yield (source, data, kind) for each block in a blk*.dat file."""
+    magic = None
+    for num in itertools.count(1):
+        source = '%s:%d' % (filename, num)
+        header = f.read(_block_frame.size)
+        # Files end with preallocated space that is filled with zeroes.
+        if not header.strip(b'\x00'):
+            return
+        if len(header) < _block_frame.size:
+            yield (source, 'Block frame is truncated', INVALID_ITEM)
+            return
+        frame_magic, size = _block_frame.unpack(header)
+        magic = magic or frame_magic
+        if frame_magic != magic:
+            yield (source, 'Block frame has unexpected magic bytes', INVALID_ITEM)
+            return
+        data = f.read(size)
+        if len(data) < size:
+            yield (source, 'Block is truncated', INVALID_ITEM)
+            return
+        yield (source, data, RAW_ITEM)
+
+def is_block(f):
+    """Check whether f starts with a block, by looking for its coinbase transaction."""
+    try:
+        f.seek(_min_block_size)
+        VarIntSerializer.stream_deserialize(f)
+        return is_coinbase(Transaction.stream_deserialize(f))
+    except Exception:
+        return False
+    finally:
+        f.seek(0)
+
+def read_tx_file(filename, f):
+    """Yield (source, data, kind) for each of the consecutive transactions in f.
+
+    A file that holds a single transaction is its source.
+    """
+    size = os.fstat(f.fileno()).st_size
+    for num in itertools.count(1):
+        start = f.tell()
+        if start >= size:
+            return
+        try:
+            Transaction.stream_deserialize(f)
+        except Exception as e:
+            yield ('%s:%d' % (filename, num), str(e) or e.__class__.__name__, INVALID_ITEM)
+            return
+        end = f.tell()
+        source = filename if num == 1 and end == size else '%s:%d' % (filename, num)
+        f.seek(start)
+        yield (source, f.read(end - start), RAW_ITEM)
+
+def read_items(path):
+    """Yield (source, data, kind) for each transaction or block in path."""
+    for filename in iter_files(path):
+        with open(filename, 'rb') as f:
+            head = f.read(1024)
+            f.seek(0)
+            if head and set(head.decode('latin-1')) <= _text_chars:
+                for line_num, line in enumerate(f, 1):
+                    line = line.strip()
+                    if line:
+                        yield ('%s:%d' % (filename, line_num), line, HEX_ITEM)
+            elif is_block_file(f):
+                for item in read_block_file(filename, f):
+                    yield item
+            elif is_block(f):
+                yield (filename, f.read(), RAW_ITEM)
+            else:
+                for item in read_tx_file(filename, f):
+                    yield item
+
+def deserialize_txs(raw):
+    """Deserialize raw as a transaction, or else as a block of transactions."""
+    try:
+        return [Transaction.deserialize(raw)]
+    except Exception:
+        block = CBlock.deserialize(raw)
+        return [Transaction.from_tx(tx) for tx in block.vtx]
+
+def is_coinbase(tx):
+    return len(tx.vin) == 1 and tx.vin[0].prevout.hash == b'\x00'*32 and tx.vin[0].prevout.n == 0xffffffff
+
+def audit_item(item):
+    """Get AuditResults for the transactions in item that have unsigned outputs.
+
+    Coinbase transactions are not reported, since they have no signatures.
+    """
+    source, data, kind = item
+    if kind == INVALID_ITEM:
+        return [AuditResult(source, None, 0, [], data)]
+    try:
+        txs = deserialize_txs(x(data.decode('latin-1')) if kind == HEX_ITEM else data)
+    except Exception as e:
+        return [AuditResult(source, None, 0, [], str(e) or e.__class__.__name__)]
+
+    results = []
+    for tx in txs:
+        if is_coinbase(tx):
+            continue
+        unsigned_outputs = get_unsigned_outputs(tx)
+        if unsigned_outputs:
+            results.append(AuditResult(source, b2lx(tx.GetHash()), len(tx.vout), unsigned_outputs, None))
+    return results
+
+def _activate_preset(preset):
+    """Make preset the active chainparams preset in a worker process."""
+    chainparams.add_preset(preset)
+    chainparams.set_to_preset(preset.name)
+
+def audit(paths, processes=None, chunksize=32, stop=None):
+    """Audit the transactions in files for outputs that are not signed.
+
+    Items are read and deserialized with the chainparams preset that is
+    active when the audit starts, including in worker processes.
+
+    Args:
+        paths (list): Paths of files or directories to read.
+        processes (int): Number of worker processes. If 1, items are
+            audited in the current process.
+        chunksize (int): Number of items sent to a worker at a time.
+        stop (threading.Event): If given, the audit stops once it is set.
+
+    Yields:
+        An AuditResult for each transaction with outputs that are not covered
+        by a SIGHASH_ALL or SIGHASH_SINGLE signature, and for each item that
+        could not be deserialized. Results are in the order that items were read.
+    """
+    items = itertools.chain.from_iterable(read_items(path) for path in paths)
+    results = workers.imap(audit_item, items, processes, chunksize,
+                           initializer=_activate_preset, initargs=(chainparams.active_preset,))
+    try:
+        for item_results in results:
+            if stop is not None and stop.is_set():
+                return
+            for result in item_results:
+                yield result
+    finally:
+        results.close()
+
+def format_result(result):
+    if result.error:
+        return '%s: could not deserialize (%s)' % (result.source, result.error)
+    return '%s: %s has %d of %d outputs unsigned: %s' % (result.source, result.txid, len(result.unsigned_outputs),
+            result.num_outputs, ', '.join(str(i) for i in result.unsigned_outputs))
@@ -0,0 +1,153 @@
+"""Detection and replacement of unsigned transaction outputs."""
+from bitcoin.core.script import CScript, CScriptInvalidError, SIGHASH_NONE, SIGHASH_SINGLE
+from bitcoin.wallet import CBitcoinAddress
+
+from hashmal_lib.core import Script, chainparams
+from hashmal_lib.core.transaction import Transaction
+from hashmal_lib.core.utils import is_hex
+
+from hashmal_plugins import tx_offsets
+
+def is_signature(data):
+    """Get whether data looks like a DER signature followed by a sighash byte."""
+    return 9 <= len(data) <= 73 and data[0:1] == b'\x30' and ord(data[1:2]) == len(data) - 3
+
+def get_hash_types(script):
+    """Get the sighash byte of every signature pushed by script."""
+    hash_types = []
+    try:
+        for _, data, _ in CScript(script).raw_iter():
+            if data is not None and is_signature(data):
+                hash_types.append(ord(data[-1:]))
+    except CScriptInvalidError:
+        pass
+    return hash_types
+
+def get_witness_hash_types(stack):
+    """Get the sighash byte of every signature in a witness stack."""
+    return [ord(data[-1:]) for data in stack if is_signature(data)]
+
+def get_input_hash_types(tx, i):
+    """Get the sighash byte of every signature in the scriptSig and witness of input i."""
+    hash_types = get_hash_types(tx.vin[i].scriptSig)
+    wit = getattr(tx, 'wit', None)
+    if wit is not None and i < len(wit.vtxinwit):
+        hash_types.extend(get_witness_hash_types(wit.vtxinwit[i].scriptWitness.stack))
+    return hash_types
+
+def get_unsigned_outputs(tx):
+    """Get the indices of outputs in tx that are not covered by any signature.
+
+    Signatures are read from input scripts and, for segwit inputs, witnesses.
+    """
+    signed = set()
+    for i in range(len(tx.vin)):
+        for hash_type in get_input_hash_types(tx, i):
+            base_type = hash_type & 0x1f
+            if base_type == SIGHASH_NONE:
+                continue
+            elif base_type == SIGHASH_SINGLE:
+                signed.add(i)
+            # Other types sign all outputs.
+            else:
+                return []
+
+    return [i for i in range(len(tx.vout)) if i not in signed]
+
+def output_script_type(script):
+    """Get the name of the standard type of an output script."""
+    script = bytes(script)
+    size = len(script)
+    if size == 25 and script[:3] == b'\x76\xa9\x14' and script[-2:] == b'\x88\xac':
+        return 'P2PKH'
+    elif size == 23 and script[:2] == b'\xa9\x14' and script[-1:] == b'\x87':
+        return 'P2SH'
+    elif size in [35, 67] and ord(script[:1]) == size - 2 and script[-1:] == b'\xac':
+        return 'P2PK'
+    elif size == 22 and script[:2] == b'\x00\x14':
+        return 'P2WPKH'
+    elif size == 34 and script[:2] == b'\x00\x20':
+        return 'P2WSH'
+    elif script[:1] == b'\x6a':
+        return 'Null Data'
+    return 'Nonstandard'
+
+def output_destination(script):
+    """Get the address that an output script pays to, or an empty string."""
+    try:
+        return str(CBitcoinAddress.from_scriptPubKey(CScript(script)))
+    except Exception:
+        return ''
+
+def format_value(value):
+    """Format an amount of satoshis as coins."""
+    sign = '-' if value < 0 else ''
+    return sign + '%d.%08d' % divmod(abs(value), 100000000)
+
+def claim_script(hash160):
+    """Get the output script that unsigned outputs are replaced with."""
+    if not is_hex(hash160) and len(hash160.replace('0x', '')) == 40:
+        raise ValueError('hash160 must be 40 hex digits.')
+    return Script.from_human('OP_DUP OP_HASH160 %s OP_EQUALVERIFY OP_CHECKSIG' % hash160)
+
+def uses_bitcoin_layout():
+    """Get whether the active chainparams preset serializes transactions as Bitcoin does."""
+    return chainparams.active_preset.name == 'Bitcoin'
+
+def deserialize_tx(raw_tx):
+    """Deserialize a transaction with the active chainparams preset.
+
+    Returns:
+        A tuple of (tx, offsets). offsets is the TxOffsets index of raw_tx,
+        or None if raw_tx does not use the Bitcoin layout.
+    """
+    tx = Transaction.deserialize(raw_tx)
+    offsets = None
+    if uses_bitcoin_layout():
+        offsets = tx_offsets.index_tx(tx)
+        # Varints that are not minimally encoded move the offsets.
+        if offsets.end != len(raw_tx):
+            offsets = None
+    return tx, offsets
+
+def _replace_tx_outputs(tx, unsigned_outputs, out_script):
+    new_tx = Transaction.from_tx(tx)
+    for o in unsigned_outputs:
+        new_tx.vout[o].scriptPubKey = out_script
+    return new_tx
+
+def replace_raw_outputs(raw_tx, hash160, tx=None, offsets=None):
+    """Replace unsigned outputs in a serialized transaction.
+
+    If the offsets of raw_tx are known, the new output scripts are spliced
+    into it. Otherwise the transaction is copied with its outputs replaced
+    and reserialized.
+
+    Args:
+        raw_tx (bytes): Serialized transaction.
+        hash160 (str): Hash160 that unsigned outputs are paid to.
+        tx (Transaction): raw_tx deserialized, as returned with offsets by
+            deserialize_tx(). If not given, raw_tx is deserialized.
+        offsets (TxOffsets): Index of raw_tx, or None.
+
+    Returns:
+        A tuple of (serialized transaction, indices of replaced outputs).
+    """
+    out_script = claim_script(hash160)
+    if tx is None:
+        tx, offsets = deserialize_tx(raw_tx)
+    unsigned_outputs = get_unsigned_outputs(tx)
+    if not unsigned_outputs:
+        return raw_tx, []
+    if offsets is None:
+        return _replace_tx_outputs(tx, unsigned_outputs, out_script).serialize(), unsigned_outputs
+    new_scripts = dict((i, out_script) for i in unsigned_outputs)
+    return tx_offsets.splice_scripts(raw_tx, offsets.outputs, new_scripts), unsigned_outputs
+
+def replace_outputs(tx, hash160):
+    """Replace unsigned outputs in tx."""
+    out_script = claim_script(hash160)
+    unsigned_outputs = get_unsigned_outputs(tx)
+    if not unsigned_outputs:
+        return tx
+    return _replace_tx_outputs(tx, unsigned_outputs, out_script)
@@ -1,81 +1,124 @@
-from bitcoin.core import x, lx, b2x, b2lx
-from bitcoin.core.script import SIGHASH_NONE
+from collections import OrderedDict
+import threading
+
+from bitcoin.core import x, b2x
 from bitcoin.base58 import CBase58Data
 
 from PyQt4.QtGui import *
 from PyQt4.QtCore import *
 
-from hashmal_lib.core import Script
-from hashmal_lib.core.transaction import Transaction, sighash_types, sighash_types_by_value
+from hashmal_lib.core import chainparams
 from hashmal_lib.core.utils import is_hex
 from hashmal_lib.plugins.base import BaseDock, Plugin, Category, augmenter
 from hashmal_lib.plugins.item_types import ItemAction
-from hashmal_lib.gui_utils import monospace_font
+from hashmal_lib.gui_utils import floated_buttons, monospace_font
+
+from audit import audit, format_result
+from claims import (deserialize_tx, get_unsigned_outputs, replace_raw_outputs, format_value,
+                    output_script_type, output_destination)
 
 
 def make_plugin():
     return Plugin(CoinClaimer, category=Category.Tx)
 
-def get_unsigned_outputs(tx):
-    # sighash types for each input
-    hash_types = []
-    for i, txin in enumerate(tx.vin):
-        try:
-            sig = Script(txin.scriptSig).get_human().split()[-2]
-        except IndexError:
-            hash_types.append(SIGHASH_NONE)
-        else:
-            hash_type = int(sig[-2:], 16)
-            hash_types.append(hash_type)
-
-    # sighash type names
-    hash_names = map(lambda i: sighash_types_by_value.get(i), hash_types)
-    # No unsigned outputs if SIGHASH_ALL is used.
-    if any('SIGHASH_ALL' in i for i in hash_names):
-        return []
-
-    unsigned_outputs = range(len(tx.vout))
-    # Evaluate sighash types.
-    for i, name in enumerate(hash_names):
-        if 'SIGHASH_SINGLE' in name:
-            unsigned_outputs.remove(i)
-    return unsigned_outputs
-
-def replace_outputs(tx, hash160):
-    """Replace unsigned outputs in tx."""
-    if not is_hex(hash160) and len(hash160.replace('0x', '')) == 40:
-        raise ValueError('hash160 must be 40 hex digits.')
-    out_script = Script.from_human('OP_DUP OP_HASH160 %s OP_EQUALVERIFY OP_CHECKSIG' % hash160)
-
-    unsigned_outputs = get_unsigned_outputs(tx)
-    if not unsigned_outputs:
-        return tx
-    new_tx = Transaction.from_tx(tx)
-    for o in unsigned_outputs:
-        new_tx.vout[o].scriptPubKey = out_script
-    return new_tx
+def decode_raw_tx(txt):
+    """Decode a hex transaction.
+
+    Returns a tuple of (tx, offsets, unsigned outputs), or (None, None, [])
+    if txt is not a transaction. See deserialize_tx() for offsets.
+    """
+    try:
+        tx, offsets = deserialize_tx(x(txt))
+    except Exception:
+        return None, None, []
+    return tx, offsets, get_unsigned_outputs(tx)
+
+def decode_key(txt):
+    """Get the key that the decoding of txt is cached under.
+
+    Decoding depends on the active chainparams preset, so its name is part of the key.
+    """
+    return (chainparams.active_preset.name, txt)
+
+class TxDecoder(QObject):
+    """Decodes raw transactions on a background thread.
+
+    Only the latest request is kept: a request that is superseded before
+    the thread gets to it is dropped.
+    """
+    txDecoded = pyqtSignal(int, object, object, object, object)
 
+    def __init__(self, parent=None):
+        super(TxDecoder, self).__init__(parent)
+        self.condition = threading.Condition()
+        self.pending = None
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def request(self, request_id, txt):
+        with self.condition:
+            self.pending = (request_id, txt)
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.pending is None:
+                    self.condition.wait()
+                request_id, txt = self.pending
+                self.pending = None
+            key = decode_key(txt)
+            tx, offsets, unsigned_outputs = decode_raw_tx(txt)
+            self.txDecoded.emit(request_id, key, tx, offsets, unsigned_outputs)
 
 class ClaimableModel(QAbstractTableModel):
+    """Model of a transaction's outputs and whether they are signed.
+
+    The value, type and destination of an output are computed when its row
+    is first displayed, and cached until the transaction changes.
+    """
+    INDEX = 0
+    STATUS = 1
+    VALUE = 2
+    SCRIPT_TYPE = 3
+    DESTINATION = 4
+    headers = [
+        ('Output', 'Output Index'),
+        ('Status', 'Output Status'),
+        ('Value', 'Output Value'),
+        ('Type', 'Output Script Type'),
+        ('Destination', 'Output Destination'),
+    ]
+
     def __init__(self, parent=None):
         super(ClaimableModel, self).__init__()
         self.tx = None
-        self.unsigned_outputs = []
-
-    def set_tx(self, tx):
-        self.beginResetModel()
+        self.unsigned_outputs = set()
+        # {row: (value, script type, destination)}
+        self.rows = {}
+
+    def set_tx(self, tx, unsigned_outputs=None):
+        if unsigned_outputs is None:
+            unsigned_outputs = get_unsigned_outputs(tx) if tx else []
+        num_rows = len(tx.vout) if tx else 0
+        # Views only need to refresh their cells if the number of rows is unchanged.
+        reset = num_rows != self.rowCount() or not num_rows
+        if reset:
+            self.beginResetModel()
         self.tx = tx
-        self.unsigned_outputs = get_unsigned_outputs(self.tx) if self.tx else []
-        self.endResetModel()
+        self.unsigned_outputs = set(unsigned_outputs)
+        self.rows = {}
+        if reset:
+            self.endResetModel()
+        else:
+            self.dataChanged.emit(self.index(0, 0), self.index(num_rows - 1, len(self.headers) - 1))
 
     def clear(self):
-        self.beginResetModel()
-        self.tx = None
-        self.unsigned_outputs = []
-        self.endResetModel()
+        self.set_tx(None, [])
 
     def columnCount(self, parent=QModelIndex()):
-        return 2
+        return len(self.headers)
 
     def rowCount(self, parent=QModelIndex()):
         if not self.tx:
@@ -83,21 +126,22 @@ class ClaimableModel(QAbstractTableModel):
         return len(self.tx.vout)
 
     def headerData(self, section, orientation, role = Qt.DisplayRole):
-        if orientation != Qt.Horizontal:
+        if orientation != Qt.Horizontal or not 0 <= section < len(self.headers):
             return None
 
-        data = None
-        if section == 0:
-            if role == Qt.DisplayRole:
-                data = 'Output'
-            elif role == Qt.ToolTipRole:
-                data = 'Output Index'
-        elif section == 1:
-            if role == Qt.DisplayRole:
-                data = 'Status'
-            elif role == Qt.ToolTipRole:
-                data = 'Output Status'
-
+        if role == Qt.DisplayRole:
+            return self.headers[section][0]
+        elif role == Qt.ToolTipRole:
+            return self.headers[section][1]
+        return None
+
+    def row_data(self, row):
+        data = self.rows.get(row)
+        if data is None:
+            txout = self.tx.vout[row]
+            data = (format_value(txout.nValue), output_script_type(txout.scriptPubKey),
+                    output_destination(txout.scriptPubKey))
+            self.rows[row] = data
         return data
 
     def data(self, index, role = Qt.DisplayRole):
@@ -106,18 +150,37 @@ class ClaimableModel(QAbstractTableModel):
 
         data = None
         c = index.column()
-        if c == 0:
+        if c == self.INDEX:
             if role in [Qt.DisplayRole, Qt.EditRole, Qt.ToolTipRole]:
                 data = index.row()
-        elif c == 1:
+        elif c == self.STATUS:
             is_unsigned = index.row() in self.unsigned_outputs
             if role in [Qt.DisplayRole, Qt.EditRole]:
                 data = 'Unsigned' if is_unsigned else 'Signed'
             elif role == Qt.ToolTipRole:
                 data = 'Unsigned output' if is_unsigned else 'Signed output'
+        elif role in [Qt.DisplayRole, Qt.EditRole, Qt.ToolTipRole]:
+            data = self.row_data(index.row())[c - self.VALUE]
 
         return data
 
+class AuditThread(QThread):
+    """Thread that audits files for unsigned outputs."""
+    resultReady = pyqtSignal(object)
+
+    def __init__(self, paths, parent=None):
+        super(AuditThread, self).__init__(parent)
+        self.paths = paths
+        self.stop_event = threading.Event()
+
+    def cancel(self):
+        """Stop the audit and its worker processes."""
+        self.stop_event.set()
+
+    def run(self):
+        for result in audit(self.paths, stop=self.stop_event):
+            self.resultReady.emit(result)
+
 class CoinClaimer(BaseDock):
     tool_name = 'Coin Claimer'
     description = 'Coin Claimer allows you to change unsigned outputs in transactions.'
@@ -127,8 +190,27 @@ class CoinClaimer(BaseDock):
     def item_actions(self, *args):
         return ItemAction(self.tool_name, 'Transaction', 'Claim unsigned outputs', self.claim_item)
 
+    # Milliseconds to wait after the raw tx is edited before decoding it.
+    decode_delay = 250
+    decode_cache_size = 8
+
     def init_data(self):
         self.tx = None
+        self.raw_tx = None
+        self.tx_offsets = None
+        # Requests are numbered so that results for stale text are ignored.
+        self.decode_request = 0
+        self.decoded_request = 0
+        self.decoded_preset = None
+        self.decode_cache = OrderedDict()
+        self.decoder = TxDecoder(self)
+        self.decoder.txDecoded.connect(self.set_decoded_tx)
+        self.decode_timer = QTimer(self)
+        self.decode_timer.setSingleShot(True)
+        self.decode_timer.setInterval(self.decode_delay)
+        self.decode_timer.timeout.connect(self.decode_tx)
+        self.audit_thread = None
+        self.audit_count = 0
 
     def create_layout(self):
         form = QFormLayout()
@@ -168,14 +250,32 @@ class CoinClaimer(BaseDock):
         self.model = ClaimableModel()
         self.view = QTableView()
         self.view.setModel(self.model)
-        self.view.horizontalHeader().setResizeMode(1, QHeaderView.Stretch)
+        self.view.horizontalHeader().setResizeMode(ClaimableModel.DESTINATION, QHeaderView.Stretch)
         self.view.verticalHeader().setVisible(False)
         self.view.setWhatsThis('The status of the transaction\'s outputs are displayed here.')
 
+        self.audit_button = QPushButton('Audit...')
+        audit_menu = QMenu(self.audit_button)
+        audit_menu.addAction('Files...', self.audit_files)
+        audit_menu.addAction('Directory...', self.audit_directory)
+        audit_menu.addSeparator()
+        audit_menu.addAction('Cancel', self.cancel_audit)
+        self.audit_button.setMenu(audit_menu)
+        self.audit_button.setWhatsThis('Check files of raw transactions or blocks for transactions with unsigned outputs.')
+        self.audit_edit = QPlainTextEdit()
+        self.audit_edit.setReadOnly(True)
+        self.audit_edit.setFont(monospace_font)
+        self.audit_edit.setWhatsThis('Transactions with unsigned outputs found by an audit are listed here.')
+        audit_form = QFormLayout()
+        audit_form.setRowWrapPolicy(QFormLayout.WrapAllRows)
+        audit_form.addRow(floated_buttons([self.audit_button]))
+        audit_form.addRow('Audit results:', self.audit_edit)
+
         vbox = QVBoxLayout()
         vbox.addLayout(rawtx_form)
         vbox.addWidget(self.view)
         vbox.addLayout(form)
+        vbox.addLayout(audit_form)
         return vbox
 
     def raw_tx_context_menu(self, pos):
@@ -197,16 +297,52 @@ class CoinClaimer(BaseDock):
                 return self.destination_edit.setText(var_value)
 
     def check_raw_tx(self):
-        txt = str(self.raw_tx_edit.toPlainText())
-        try:
-            tx = Transaction.deserialize(x(txt))
-        except Exception:
-            tx = None
+        """Schedule the raw tx to be decoded once editing pauses."""
+        self.decode_request += 1
+        self.decode_timer.start()
+
+    def on_option_changed(self, key):
+        # The decoded tx depends on the chainparams preset.
+        if key == 'chainparams':
+            self.check_raw_tx()
+
+    def decode_tx(self):
+        txt = str(self.raw_tx_edit.toPlainText()).strip()
+        key = decode_key(txt)
+        cached = self.decode_cache.get(key)
+        if cached is not None:
+            self.set_decoded_tx(self.decode_request, key, *cached)
+        else:
+            self.decoder.request(self.decode_request, txt)
+
+    def decode_tx_now(self):
+        """Decode the raw tx on this thread if its latest text has not been decoded."""
+        if self.decoded_request == self.decode_request and self.decoded_preset == chainparams.active_preset.name:
+            return
+        self.decode_timer.stop()
+        txt = str(self.raw_tx_edit.toPlainText()).strip()
+        key = decode_key(txt)
+        cached = self.decode_cache.get(key) or decode_raw_tx(txt)
+        self.set_decoded_tx(self.decode_request, key, *cached)
+
+    def set_decoded_tx(self, request_id, key, tx, offsets, unsigned_outputs):
+        self.decode_cache.pop(key, None)
+        self.decode_cache[key] = (tx, offsets, unsigned_outputs)
+        if len(self.decode_cache) > self.decode_cache_size:
+            self.decode_cache.popitem(last=False)
+
+        if request_id != self.decode_request:
+            return
+        self.decoded_request = request_id
+        self.decoded_preset, txt = key
         self.tx = tx
-        self.model.set_tx(tx)
+        self.raw_tx = x(txt) if tx else None
+        self.tx_offsets = offsets
+        self.model.set_tx(tx, unsigned_outputs)
 
     def do_claim(self):
         """Replace unsigned outputs."""
+        self.decode_tx_now()
         if not self.tx:
             self.error('Invalid or nonexistent transaction.')
             return
@@ -225,14 +361,50 @@ class CoinClaimer(BaseDock):
             self.error('Could not parse destination: %s' % hash160)
             return
 
-        if not get_unsigned_outputs(self.tx):
+        new_raw, unsigned_outputs = replace_raw_outputs(self.raw_tx, hash160, self.tx, self.tx_offsets)
+        if not unsigned_outputs:
             self.error('There are no unsigned outputs.')
             return
-        new_tx = replace_outputs(self.tx, hash160)
 
-        self.result_edit.setPlainText(b2x(new_tx.serialize()))
+        self.result_edit.setPlainText(b2x(new_raw))
         self.info('Successfully altered outputs: %s' % unsigned_outputs)
 
+    def audit_files(self):
+        paths = QFileDialog.getOpenFileNames(self, 'Audit Files')
+        if paths:
+            self.start_audit([str(i) for i in paths])
+
+    def audit_directory(self):
+        path = QFileDialog.getExistingDirectory(self, 'Audit Directory')
+        if path:
+            self.start_audit([str(path)])
+
+    def start_audit(self, paths):
+        """Audit paths in the background."""
+        if self.audit_thread and self.audit_thread.isRunning():
+            self.error('An audit is already running.')
+            return
+        self.audit_edit.clear()
+        self.audit_count = 0
+        self.audit_thread = AuditThread(paths)
+        self.audit_thread.resultReady.connect(self.add_audit_result)
+        self.audit_thread.finished.connect(self.audit_finished)
+        self.audit_thread.start()
+
+    def cancel_audit(self):
+        if self.audit_thread and self.audit_thread.isRunning():
+            self.audit_thread.cancel()
+
+    def add_audit_result(self, result):
+        self.audit_edit.appendPlainText(format_result(result))
+        self.audit_count += 1
+
+    def audit_finished(self):
+        if self.audit_thread.stop_event.is_set():
+            self.info('Audit cancelled with %d results.' % self.audit_count)
+        else:
+            self.info('Audit finished with %d results.' % self.audit_count)
+
     def claim_item(self, item):
         self.needsFocus.emit()
         self.raw_tx_edit.setPlainText(item.raw())
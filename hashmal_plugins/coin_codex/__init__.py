@@ -1,2 +0,0 @@
-import explorers
-import coin_codex
@@ -0,0 +1,144 @@
+"""Streaming reader for files of raw Decred blocks.
+
+Block files are memory-mapped and walked in place. Headers and transactions
+are only decoded when they are accessed, so scanning a file does not load
+its blocks into memory.
+"""
+from __future__ import absolute_import
+
+import mmap
+import os
+import struct
+from collections import namedtuple
+
+from bitcoin.core.serialize import SerializationTruncationError
+
+from hashmal_lib.core.transaction import Transaction
+
+from .core import wire
+from .hashmal_decred import dcr_header_fields
+
+def fields_struct(fields):
+    """Build a struct for a list of fixed-size fields."""
+    fmt = [b'<']
+    for field in fields:
+        if field.fmt in ['hash', 'bytes']:
+            fmt.append(b'%ds' % field.num_bytes)
+        else:
+            fmt.append(field.fmt.lstrip(b'<'))
+    return struct.Struct(b''.join(fmt))
+
+header_struct = fields_struct(dcr_header_fields)
+DecredHeader = namedtuple('DecredHeader', [field.attr for field in dcr_header_fields])
+
+class MappedReader(wire.BufferCursor):
+    """File-like reader over a region of a mapping.
+
+    Transactions are deserialized from it in place: fixed-size fields are
+    unpacked from the mapping, and only scripts are copied out.
+    """
+    def __init__(self, mapping, start=0, end=None):
+        super(MappedReader, self).__init__(mapping, start, end)
+        self.mapping = mapping
+
+    def read(self, n=-1):
+        """Read n bytes, or the rest of the region if n is negative.
+
+        Raises SerializationTruncationError if fewer than n bytes remain.
+        """
+        if n < 0:
+            n = self.end - self.pos
+        return super(MappedReader, self).read(n)
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self.pos - self.start
+        elif whence == 2:
+            offset += self.end - self.start
+        self.pos = self.start + offset
+
+    def tell(self):
+        return self.pos - self.start
+
+class MappedTx(object):
+    """Serialized transaction within a mapping."""
+    def __init__(self, mapping, start, end):
+        self.mapping = mapping
+        self.start = start
+        self.end = end
+
+    def __len__(self):
+        return self.end - self.start
+
+    def raw(self):
+        """Copy the serialized transaction out of the mapping."""
+        return self.mapping[self.start:self.end]
+
+    def deserialize(self):
+        """Deserialize the transaction directly from the mapping."""
+        return Transaction.stream_deserialize(MappedReader(self.mapping, self.start, self.end))
+
+class MappedBlock(object):
+    """Serialized block within a mapping.
+
+    Only the offsets of the block's transaction trees are recorded when
+    it is created.
+    """
+    def __init__(self, mapping, offset):
+        self.mapping = mapping
+        self.offset = offset
+        self.tx_offset = offset + header_struct.size
+        if self.tx_offset > len(mapping):
+            raise SerializationTruncationError('Block header is truncated')
+        self.stx_offset = self._skip_tree(self.tx_offset)
+        self.end = self._skip_tree(self.stx_offset)
+
+    def _skip_tree(self, offset):
+        count, offset = wire.read_varint_at(self.mapping, offset)
+        for _ in range(count):
+            offset = wire.tx_end_at(self.mapping, offset)
+        return offset
+
+    def _iter_tree(self, offset):
+        count, offset = wire.read_varint_at(self.mapping, offset)
+        for _ in range(count):
+            end = wire.tx_end_at(self.mapping, offset)
+            yield MappedTx(self.mapping, offset, end)
+            offset = end
+
+    def __len__(self):
+        return self.end - self.offset
+
+    @property
+    def header(self):
+        return DecredHeader._make(header_struct.unpack_from(self.mapping, self.offset))
+
+    def raw_header(self):
+        return self.mapping[self.offset:self.tx_offset]
+
+    def transactions(self):
+        """Iterate over the regular transaction tree."""
+        return self._iter_tree(self.tx_offset)
+
+    def stake_transactions(self):
+        """Iterate over the stake transaction tree."""
+        return self._iter_tree(self.stx_offset)
+
+def read_blocks(path):
+    """Iterate over a file of concatenated raw Decred blocks.
+
+    Blocks (and the transactions obtained from them) refer to the mapped
+    file, and can only be used until iteration finishes.
+    """
+    if not os.path.getsize(path):
+        return
+    with open(path, 'rb') as f:
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        offset = 0
+        while offset < len(mapping):
+            block = MappedBlock(mapping, offset)
+            yield block
+            offset = block.end
+    finally:
+        mapping.close()
@@ -0,0 +1,92 @@
+"""BLAKE-256, the hash function used by Decred."""
+import struct
+
+IV = (
+    0x6a09e667, 0xbb67ae85, 0x3c6ef372, 0xa54ff53a,
+    0x510e527f, 0x9b05688c, 0x1f83d9ab, 0x5be0cd19,
+)
+
+C = (
+    0x243f6a88, 0x85a308d3, 0x13198a2e, 0x03707344,
+    0xa4093822, 0x299f31d0, 0x082efa98, 0xec4e6c89,
+    0x452821e6, 0x38d01377, 0xbe5466cf, 0x34e90c6c,
+    0xc0ac29b7, 0xc97c50dd, 0x3f84d5b5, 0xb5470917,
+)
+
+SIGMA = (
+    (0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15),
+    (14, 10, 4, 8, 9, 15, 13, 6, 1, 12, 0, 2, 11, 7, 5, 3),
+    (11, 8, 12, 0, 5, 2, 15, 13, 10, 14, 3, 6, 7, 1, 9, 4),
+    (7, 9, 3, 1, 13, 12, 11, 14, 2, 6, 5, 10, 4, 0, 15, 8),
+    (9, 0, 5, 7, 2, 4, 10, 15, 14, 1, 11, 12, 6, 8, 3, 13),
+    (2, 12, 6, 10, 0, 11, 8, 3, 4, 13, 7, 5, 15, 14, 1, 9),
+    (12, 5, 1, 15, 14, 13, 4, 10, 0, 7, 6, 3, 9, 2, 8, 11),
+    (13, 11, 7, 14, 12, 1, 3, 9, 5, 0, 15, 4, 8, 6, 2, 10),
+    (6, 15, 14, 9, 11, 3, 0, 8, 12, 2, 13, 7, 1, 4, 10, 5),
+    (10, 2, 8, 4, 7, 6, 1, 5, 15, 11, 9, 14, 3, 12, 13, 0),
+)
+
+ROUNDS = 14
+
+# (a, b, c, d) state indexes for each of the eight G functions in a round.
+G_INDEXES = (
+    (0, 4, 8, 12), (1, 5, 9, 13), (2, 6, 10, 14), (3, 7, 11, 15),
+    (0, 5, 10, 15), (1, 6, 11, 12), (2, 7, 8, 13), (3, 4, 9, 14),
+)
+
+_block = struct.Struct(b'>16I')
+_digest = struct.Struct(b'>8I')
+MASK = 0xffffffff
+
+def pad(data):
+    """Pad data to a multiple of 64 bytes.
+
+    Returns a tuple of (padded data, bit counter for each block).
+    """
+    bit_len = len(data) * 8
+    padding = 56 - len(data) % 64
+    if padding <= 0:
+        padding += 64
+    if padding > 1:
+        tail = b'\x80' + b'\x00' * (padding - 2) + b'\x01'
+    else:
+        tail = b'\x81'
+    padded = data + tail + struct.pack(b'>Q', bit_len)
+
+    counters = []
+    for i in range(len(padded) // 64):
+        consumed = min((i + 1) * 512, bit_len)
+        # A block without any message bits uses a counter of zero.
+        counters.append(consumed if i * 512 < bit_len else 0)
+    return padded, counters
+
+def compress(h, m, t):
+    """Compress the message block m (16 words) into the chain value h."""
+    v = list(h) + [C[0], C[1], C[2], C[3],
+                   (t & MASK) ^ C[4], (t & MASK) ^ C[5],
+                   (t >> 32) ^ C[6], (t >> 32) ^ C[7]]
+    for r in range(ROUNDS):
+        s = SIGMA[r % 10]
+        for i, (a, b, c, d) in enumerate(G_INDEXES):
+            x, y = s[2 * i], s[2 * i + 1]
+            va = (v[a] + v[b] + (m[x] ^ C[y])) & MASK
+            vd = v[d] ^ va
+            vd = ((vd >> 16) | (vd << 16)) & MASK
+            vc = (v[c] + vd) & MASK
+            vb = v[b] ^ vc
+            vb = ((vb >> 12) | (vb << 20)) & MASK
+            va = (va + vb + (m[y] ^ C[x])) & MASK
+            vd = vd ^ va
+            vd = ((vd >> 8) | (vd << 24)) & MASK
+            vc = (vc + vd) & MASK
+            vb = vb ^ vc
+            v[a], v[b], v[c], v[d] = va, ((vb >> 7) | (vb << 25)) & MASK, vc, vd
+    return [h[i] ^ v[i] ^ v[i + 8] for i in range(8)]
+
+def blake256(data):
+    """Hash data with BLAKE-256."""
+    padded, counters = pad(bytes(data))
+    h = list(IV)
+    for i, t in enumerate(counters):
+        h = compress(h, _block.unpack_from(padded, i * 64), t)
+    return _digest.pack(*h)
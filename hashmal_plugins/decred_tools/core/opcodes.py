@@ -0,0 +1,86 @@
+"""Decred opcode tables.
+
+The tables are built from decred.core the first time one of them is read,
+so importing the Decred plugin does not import the decred script package.
+"""
+
+try:
+    from collections.abc import Mapping, Sequence
+except ImportError:
+    from collections import Mapping, Sequence
+
+_tables = None
+
+def build_tables():
+    """Build the opcode tables if they have not been built yet.
+
+    Returns a tuple of ({value: name}, {name: value}, [disabled values]).
+    """
+    global _tables
+    if _tables is None:
+        from decred.core.script import opcode
+        names = {}
+        by_name = {}
+        disabled = []
+        for op in opcode.opcodeArray:
+            names[op.value] = op.name
+            by_name[op.name] = op.value
+            if opcode.ParsedOpcode(op, b'').isDisabled():
+                disabled.append(op.value)
+        _tables = (names, by_name, disabled)
+    return _tables
+
+class LazyMapping(Mapping):
+    """Read-only mapping whose items are loaded by calling loader the first time it is read."""
+    def __init__(self, loader):
+        self.loader = loader
+        self._data = None
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = dict(self.loader())
+        return self._data
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __repr__(self):
+        return repr(self.data)
+
+    def copy(self):
+        return dict(self.data)
+
+class LazySequence(Sequence):
+    """Read-only sequence whose items are loaded by calling loader the first time it is read."""
+    def __init__(self, loader):
+        self.loader = loader
+        self._data = None
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = list(self.loader())
+        return self._data
+
+    def __getitem__(self, i):
+        return self.data[i]
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, item):
+        return item in self.data
+
+    def __repr__(self):
+        return repr(self.data)
+
+op_names = LazyMapping(lambda: build_tables()[0])
+ops_by_name = LazyMapping(lambda: build_tables()[1])
+disabled_ops = LazySequence(lambda: build_tables()[2])
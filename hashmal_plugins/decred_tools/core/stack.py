@@ -1,77 +1,634 @@
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
+import numbers
+import pickle
+import struct
+import tempfile
+import time
 
 from hashmal_lib.core.utils import push_script
 from hashmal_lib.core.stack import StackState
 
+from hashmal_plugins import workers
+
 from decred.core.transaction import *
 from decred.core import transaction
 from decred.core.script.engine import *
 from decred.core.script.scriptnum import *
-from decred.core.script.opcode import OpcodeByName
+from decred.core.script.opcode import OpcodeByName, opcodeArray
+
+from . import txhash, wire
+from .opcodes import op_names
 
 
 Step = namedtuple('Step', ('stack', 'op'))
 
-class DecredExecution(object):
-    """Decred script execution."""
-    def __init__(self):
+def to_decred_tx(tx):
+    """Build a decred.core transaction from a hashmal transaction."""
+    txins = []
+    for i in tx.vin:
+        po = transaction.OutPoint(i.prevout.hash, i.prevout.n, i.prevout.tree)
+        txins.append(transaction.TxIn(prev_out=po, sequence=i.nSequence, value=i.value,
+                    block_height=i.block_height, block_index=i.block_index,
+                    sig_script=i.scriptSig))
+
+    txouts = [transaction.TxOut(value=o.nValue, version=o.version, pk_script=o.scriptPubKey) for o in tx.vout]
+    return transaction.Transaction(version=tx.nVersion, txins=txins, txouts=txouts,
+                locktime=tx.nLockTime, expiry=tx.expiry)
+
+class DecredTxCache(object):
+    """Cache of decred.core transactions keyed by hashmal transaction hashes.
+
+    Lets every input of a transaction be evaluated without converting the
+    transaction again. The key is the hash that commits to both the prefix
+    and the witness, which is memoized on the transaction by txhash, so
+    looking up a transaction that was not edited does not serialize it.
+    """
+    def __init__(self, max_size=16):
+        self.max_size = max_size
+        self.txs = OrderedDict()
+
+    def get(self, tx):
+        key = txhash.full_hash(tx)
+        dtx = self.txs.pop(key, None)
+        if dtx is None:
+            dtx = to_decred_tx(tx)
+            if len(self.txs) >= self.max_size:
+                self.txs.popitem(last=False)
+        self.txs[key] = dtx
+        return dtx
+
+tx_cache = DecredTxCache()
+
+def _key_bytes(value):
+    if hasattr(value, 'serialize'):
+        value = value.serialize()
+    return bytes(value)
+
+class SigCache(object):
+    """Bounded LRU cache of valid signatures.
+
+    Follows the signature cache interface of the script engine, which
+    takes the cache as a constructor argument: exists() is checked before
+    a signature is verified, and signatures that verify are add()ed.
+    """
+    def __init__(self, max_entries=50000):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def exists(self, sig_hash, sig, pubkey):
+        key = (_key_bytes(sig_hash), _key_bytes(sig), _key_bytes(pubkey))
+        if self.entries.pop(key, None) is None:
+            self.misses += 1
+            return False
+        self.entries[key] = True
+        self.hits += 1
+        return True
+
+    def add(self, sig_hash, sig, pubkey):
+        key = (_key_bytes(sig_hash), _key_bytes(sig), _key_bytes(pubkey))
+        self.entries.pop(key, None)
+        if len(self.entries) >= self.max_entries:
+            self.entries.popitem(last=False)
+        self.entries[key] = True
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self.entries)}
+
+sig_cache = SigCache()
+
+ParsedOp = namedtuple('ParsedOp', ('op', 'data'))
+
+OP_PUSHDATA1 = 0x4c
+OP_PUSHDATA2 = 0x4d
+OP_PUSHDATA4 = 0x4e
+_pushdata_sizes = {OP_PUSHDATA1: (1, b'<B'), OP_PUSHDATA2: (2, b'<H'), OP_PUSHDATA4: (4, b'<I')}
+
+def parse_script(script):
+    """Parse script into a list of ParsedOps.
+
+    Returns None if script is malformed.
+    """
+    script = bytes(script)
+    ops = []
+    i = 0
+    while i < len(script):
+        value = bytearray(script[i:i + 1])[0]
+        i += 1
+        size = 0
+        if 0 < value < OP_PUSHDATA1:
+            size = value
+        elif value in _pushdata_sizes:
+            num_bytes, fmt = _pushdata_sizes[value]
+            if i + num_bytes > len(script):
+                return None
+            size = struct.unpack(fmt, script[i:i + num_bytes])[0]
+            i += num_bytes
+        if i + size > len(script):
+            return None
+        ops.append(ParsedOp(opcodeArray[value], script[i:i + size]))
+        i += size
+    return ops
+
+class ParsedScriptCache(object):
+    """Cache of parsed scripts, so that scripts evaluated repeatedly are only parsed once."""
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self.scripts = OrderedDict()
+
+    def get(self, script):
+        key = bytes(script)
+        if key in self.scripts:
+            ops = self.scripts.pop(key)
+        else:
+            ops = parse_script(key)
+            if len(self.scripts) >= self.max_size:
+                self.scripts.popitem(last=False)
+        self.scripts[key] = ops
+        return ops
+
+script_cache = ParsedScriptCache()
+
+OP_16 = 0x60
+
+# Number of topmost stack items that each opcode can pop or modify. Data
+# pushes modify none. Opcodes that are not listed, such as OP_ROLL and
+# OP_CHECKMULTISIG whose effects depend on stack values, may change any item.
+touched_depths = {}
+for _depth, _names in [
+        (0, ['OP_NOP', 'OP_ELSE', 'OP_ENDIF', 'OP_RETURN', 'OP_FROMALTSTACK', 'OP_2DUP', 'OP_3DUP', 'OP_2OVER',
+             'OP_IFDUP', 'OP_DEPTH', 'OP_DUP', 'OP_OVER', 'OP_SIZE', 'OP_CODESEPARATOR',
+             'OP_CHECKLOCKTIMEVERIFY', 'OP_CHECKSEQUENCEVERIFY', 'OP_SSTX', 'OP_SSGEN', 'OP_SSRTX', 'OP_SSTXCHANGE',
+             'OP_NOP1', 'OP_NOP4', 'OP_NOP5', 'OP_NOP6', 'OP_NOP7', 'OP_NOP8', 'OP_NOP9', 'OP_NOP10']),
+        (1, ['OP_IF', 'OP_NOTIF', 'OP_VERIFY', 'OP_TOALTSTACK', 'OP_DROP', 'OP_PICK', 'OP_INVERT',
+             'OP_1ADD', 'OP_1SUB', 'OP_2MUL', 'OP_2DIV', 'OP_NEGATE', 'OP_ABS', 'OP_NOT', 'OP_0NOTEQUAL',
+             'OP_RIPEMD160', 'OP_SHA1', 'OP_BLAKE256', 'OP_SHA256', 'OP_HASH160', 'OP_HASH256']),
+        (2, ['OP_2DROP', 'OP_NIP', 'OP_SWAP', 'OP_TUCK', 'OP_CAT', 'OP_LEFT', 'OP_RIGHT',
+             'OP_AND', 'OP_OR', 'OP_XOR', 'OP_EQUAL', 'OP_EQUALVERIFY', 'OP_ROTR', 'OP_ROTL',
+             'OP_ADD', 'OP_SUB', 'OP_MUL', 'OP_DIV', 'OP_MOD', 'OP_LSHIFT', 'OP_RSHIFT',
+             'OP_BOOLAND', 'OP_BOOLOR', 'OP_NUMEQUAL', 'OP_NUMEQUALVERIFY', 'OP_NUMNOTEQUAL',
+             'OP_LESSTHAN', 'OP_GREATERTHAN', 'OP_LESSTHANOREQUAL', 'OP_GREATERTHANOREQUAL',
+             'OP_MIN', 'OP_MAX', 'OP_CHECKSIG', 'OP_CHECKSIGVERIFY']),
+        (3, ['OP_ROT', 'OP_SUBSTR', 'OP_WITHIN', 'OP_CHECKSIGALT', 'OP_CHECKSIGALTVERIFY']),
+        (4, ['OP_2SWAP']),
+        (6, ['OP_2ROT'])]:
+    touched_depths.update(dict.fromkeys(_names, _depth))
+
+def touched_depth(op):
+    """Get the number of topmost stack items that op can pop or modify.
+
+    Returns None if op may change any item.
+    """
+    if op is None:
+        return None
+    if op.value <= OP_16:
+        return 0
+    return touched_depths.get(op.name)
+
+class StackTrace(object):
+    """Stack states of a script execution.
+
+    Each step is stored as a delta against the previous step: the number of
+    items popped and the items pushed. Full stacks are kept every
+    checkpoint_interval steps, and other steps are rebuilt from the nearest
+    checkpoint when they are viewed.
+    """
+    def __init__(self, checkpoint_interval=64):
+        self.checkpoint_interval = checkpoint_interval
+        self.deltas = []
+        self.checkpoints = {}
+        self.last_stack = []
+        # Number of stack item bytes stored.
+        self.nbytes = 0
+        # Last rebuilt step, so that sequential access only applies one delta.
+        self.cursor = (-1, [])
+
+    def append(self, stack, op):
+        """Record the stack (bottom item first) after op was executed."""
+        prev = self.last_stack
+        common = 0
+        max_common = min(len(prev), len(stack))
+        while common < max_common and prev[common] == stack[common]:
+            common += 1
+        self.append_delta(len(prev) - common, stack[common:], op)
+
+    def append_delta(self, pops, pushes, op):
+        """Record a step that popped pops items and then pushed pushes."""
+        delta = (pops, pushes, op)
+        self.nbytes += sum(len(i) for i in pushes)
+        self.store_delta(delta)
+        self._apply(self.last_stack, delta)
+        if len(self) % self.checkpoint_interval == 0:
+            self.nbytes += sum(len(i) for i in self.last_stack)
+            self.store_checkpoint(len(self) - 1, list(self.last_stack))
+
+    def store_delta(self, delta):
+        self.deltas.append(delta)
+
+    def get_delta(self, i):
+        return self.deltas[i]
+
+    def store_checkpoint(self, i, stack):
+        self.checkpoints[i] = stack
+
+    def get_checkpoint(self, i):
+        return list(self.checkpoints.get(i, []))
+
+    def close(self):
         pass
 
+    def __len__(self):
+        return len(self.deltas)
+
+    def _apply(self, stack, delta):
+        pops, pushes, _ = delta
+        if pops:
+            del stack[-pops:]
+        stack.extend(pushes)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('Step index out of range')
+
+        cursor, stack = self.cursor
+        if cursor > i or cursor < i - self.checkpoint_interval:
+            cursor = i - i % self.checkpoint_interval - 1
+            stack = self.get_checkpoint(cursor)
+        delta = None
+        while cursor < i:
+            cursor += 1
+            delta = self.get_delta(cursor)
+            self._apply(stack, delta)
+        self.cursor = (cursor, stack)
+        if delta is None:
+            delta = self.get_delta(i)
+        return StackState(list(stack), delta[2], '')
+
+    def __iter__(self):
+        stack = []
+        i = 0
+        while i < len(self):
+            delta = self.get_delta(i)
+            self._apply(stack, delta)
+            yield StackState(list(stack), delta[2], '')
+            i += 1
+
+class FileStackTrace(StackTrace):
+    """Stack trace that streams deltas and checkpoints to a temporary file.
+
+    Only file offsets and opcodes are kept in memory. Stack items are read
+    back from the file when a step is viewed.
+    """
+    def __init__(self, checkpoint_interval=64):
+        super(FileStackTrace, self).__init__(checkpoint_interval)
+        self.file = tempfile.TemporaryFile()
+
+    def write(self, value):
+        self.file.seek(0, 2)
+        offset = self.file.tell()
+        pickle.dump(value, self.file, 2)
+        return offset
+
+    def read(self, offset):
+        self.file.seek(offset)
+        return pickle.load(self.file)
+
+    def store_delta(self, delta):
+        pops, pushes, op = delta
+        offset = self.write((pops, [bytes(i) for i in pushes]))
+        self.deltas.append((offset, op))
+
+    def get_delta(self, i):
+        offset, op = self.deltas[i]
+        pops, pushes = self.read(offset)
+        return (pops, pushes, op)
+
+    def store_checkpoint(self, i, stack):
+        self.checkpoints[i] = self.write([bytes(item) for item in stack])
+
+    def get_checkpoint(self, i):
+        offset = self.checkpoints.get(i)
+        return [] if offset is None else self.read(offset)
+
+    def close(self):
+        self.file.close()
+
+OpcodeProfile = namedtuple('OpcodeProfile', ('op', 'name', 'count', 'total_time', 'max_stack_depth'))
+
+class EngineProfiler(object):
+    """Per-opcode execution statistics."""
+    def __init__(self):
+        # {opcode value: [count, total time, max stack depth]}
+        self.stats = {}
+
+    def record(self, op, elapsed, stack_depth):
+        value = op.value if op is not None else None
+        stats = self.stats.get(value)
+        if stats is None:
+            stats = self.stats[value] = [0, 0.0, 0]
+        stats[0] += 1
+        stats[1] += elapsed
+        stats[2] = max(stats[2], stack_depth)
+
+    def report(self):
+        """Get a list of OpcodeProfiles, most expensive first."""
+        report = [OpcodeProfile(value, op_names.get(value, 'UNKNOWN'), count, total_time, max_depth)
+                  for value, (count, total_time, max_depth) in self.stats.items()]
+        return sorted(report, key=lambda i: i.total_time, reverse=True)
+
+    def format_report(self):
+        """Get the report as a table of text."""
+        lines = ['%-24s %8s %12s %10s' % ('Opcode', 'Count', 'Time (ms)', 'Max Depth')]
+        for i in self.report():
+            lines.append('%-24s %8d %12.3f %10d' % (i.name, i.count, i.total_time * 1000, i.max_stack_depth))
+        return '\n'.join(lines)
+
+def int_flags(flags):
+    """Convert a tuple of script flags to an integer."""
+    intflags = 0
+    if flags:
+        for i in flags:
+            intflags |= i
+    return intflags
+
+def engine_tx(tx):
+    """Get the decred.core transaction to evaluate a script with."""
+    if not tx:
+        return transaction.Transaction(txins=(TxIn(),))
+    elif isinstance(tx, transaction.Transaction):
+        return tx
+    return tx_cache.get(tx)
+
+ExecutionResult = namedtuple('ExecutionResult', ('success', 'stack', 'error', 'op_count'))
+
+class DecredExecution(object):
+    """Decred script execution.
+
+    Evaluates scripts without recording their steps. DecredEngine
+    should be used to step through a script.
+    """
+    def __init__(self, sig_cache=sig_cache):
+        self.sig_cache = sig_cache
+
     def evaluate(self, pk_script, tx=None, in_idx=0, flags=0):
-        pass
+        """Evaluate pk_script.
+
+        Returns:
+            An ExecutionResult with whether the script succeeded, the final
+            stack (bottom item first), the error if any, and the number of
+            opcodes executed.
+        """
+        if not isinstance(flags, numbers.Integral):
+            flags = int_flags(flags)
+        engine = None
+        error = None
+        op_count = 0
+        stack = []
+        try:
+            engine = Engine(pk_script, engine_tx(tx), in_idx, flags, 0, self.sig_cache)
+            done = False
+            while not done:
+                op_count += 1
+                done = engine.step()
+        except Exception as e:
+            error = e
+
+        if engine is not None:
+            stack = [engine.dstack.peek_bytearray(i) for i in range(engine.dstack.depth())]
+            stack.reverse()
+            if not error:
+                try:
+                    engine.check_error_condition(True)
+                except Exception as e:
+                    error = e
+        return ExecutionResult(error is None, stack, error, op_count)
+
+InputResult = namedtuple('InputResult', ('in_idx', 'valid', 'error'))
+
+def verify_input(dtx, in_idx, pk_script, flags=0):
+    """Verify an input of a decred.core transaction."""
+    result = DecredExecution().evaluate(pk_script, dtx, in_idx, flags)
+    return InputResult(in_idx, result.success, None if result.success else str(result.error))
+
+def _verify_inputs(dtx, prev_scripts, flags):
+    if len(prev_scripts) != len(dtx.txins):
+        raise ValueError('Expected %d previous output scripts, got %d.' % (len(dtx.txins), len(prev_scripts)))
+    return [verify_input(dtx, i, script, flags) for i, script in enumerate(prev_scripts)]
+
+def verify_transaction(tx, prev_scripts, flags=None):
+    """Verify every input of a transaction.
+
+    Args:
+        tx (Transaction): Transaction to verify.
+        prev_scripts (list): Script of the output spent by each input.
+        flags (tuple): Script verification flags.
+
+    Returns:
+        A list of InputResult tuples.
+    """
+    return _verify_inputs(to_decred_tx(tx), prev_scripts, int_flags(flags))
+
+def _verify_raw_transaction(args):
+    raw_tx, prev_scripts, flags = args
+    try:
+        dtx = transaction.Transaction.deserialize(raw_tx)
+        return _verify_inputs(dtx, prev_scripts, flags)
+    except Exception as e:
+        return [InputResult(None, False, str(e) or e.__class__.__name__)]
+
+def _verify_jobs(txs, flags):
+    for tx, prev_scripts in txs:
+        if not isinstance(tx, (bytes, bytearray)):
+            tx = wire.serialize_tx(tx)
+        yield (bytes(tx), list(prev_scripts), flags)
+
+def verify_many(txs, processes=None, chunksize=16, flags=None):
+    """Verify the inputs of many transactions across a pool of processes.
+
+    Args:
+        txs (iterable): (tx, prev_scripts) tuples, where tx is a Transaction
+            or a serialized transaction.
+        processes (int): Number of worker processes. Defaults to the number of CPUs.
+            If 1, transactions are verified in the current process.
+        chunksize (int): Number of transactions sent to a worker at a time.
+        flags (tuple): Script verification flags.
+
+    Returns:
+        A list containing a list of InputResult tuples for each transaction.
+        If a transaction cannot be deserialized or the number of scripts
+        does not match its inputs, its list holds one InputResult with an
+        in_idx of None and the error.
+    """
+    jobs = _verify_jobs(txs, int_flags(flags))
+    return list(workers.imap(_verify_raw_transaction, jobs, processes, chunksize))
+
+LIMIT_STEPS = 'max_steps'
+LIMIT_TRACE_BYTES = 'max_trace_bytes'
+LIMIT_TIME = 'max_time'
 
 class DecredEngine(object):
-    """Decred script engine."""
-    def __init__(self, pk_script, tx=None, in_idx=0, flags=None, execution_data=None):
+    """Decred script engine.
+
+    Opcodes are executed one at a time as steps are requested, so iterating
+    over the engine yields each step as soon as it has been executed.
+
+    Execution can be bounded by max_steps, max_trace_bytes (bytes of stack
+    items stored in the trace), and max_time (seconds spent executing).
+    When a limit is reached, execution stops and limit_reached is set to
+    the name of the limit. If trace_file is True, steps are streamed to a
+    temporary file instead of being kept in memory.
+
+    If profile is True, per-opcode statistics are recorded in profiler.
+    """
+    def __init__(self, pk_script, tx=None, in_idx=0, flags=None, execution_data=None, sig_cache=sig_cache,
+                 max_steps=None, max_trace_bytes=None, max_time=None, trace_file=False, profile=False):
         # Execution data is ignored as it is not needed.
 
-        # Convert flags tuple to integer.
-        intflags = 0
-        if flags:
-            for i in flags:
-                intflags |= i
-        flags = intflags
+        flags = int_flags(flags)
 
         self.verifying = True if tx else False
-        if not tx:
-            tx = transaction.Transaction(txins=(TxIn(),))
-        else:
-            tx = transaction.Transaction.deserialize(tx.serialize())
-        self.engine = Engine(pk_script, tx, in_idx, flags, 0)
+        # Signature checks consult the cache before doing EC verification.
+        self.sig_cache = sig_cache
+        self.engine = Engine(pk_script, engine_tx(tx), in_idx, flags, 0, sig_cache)
+        self.ops, self.script_ends = self.parse_scripts(pk_script, tx, in_idx)
         self.error = None
-        self.steps = []
+        self.steps = FileStackTrace() if trace_file else StackTrace()
+        self.last_op = None
+        self.done = False
 
-        done = False
-        while done != True:
-            op = self.engine.disasm_pc(verbose=False)
-            op = OpcodeByName.get(op)
+        self.max_steps = max_steps
+        self.max_trace_bytes = max_trace_bytes
+        self.max_time = max_time
+        self.limit_reached = None
+        self.elapsed = 0.0
+        self.profiler = EngineProfiler() if profile else None
 
-            try:
-                done = self.engine.step()
-            except Exception as e:
-                self.error = str(e)
-                done = True
-
-            stack_state = []
-            for i in range(self.engine.dstack.depth()):
-                s = self.engine.dstack.peek_bytearray(i)
-                stack_state.append(s)
-            stack_state.reverse()
-            step = StackState(stack_state, op, '')
-            self.steps.append(step)
-
-        if not self.error:
+    def parse_scripts(self, pk_script, tx, in_idx):
+        """Get the opcodes that the engine will execute, in order.
+
+        Returns a tuple of (opcodes, indices of the last opcode of each
+        script). The opcodes are None if a script could not be parsed.
+        """
+        sig_script = b''
+        if isinstance(tx, transaction.Transaction):
+            sig_script = tx.txins[in_idx].sig_script
+        elif tx:
+            sig_script = tx.vin[in_idx].scriptSig
+
+        ops = []
+        ends = set()
+        for script in [sig_script, pk_script]:
+            parsed = script_cache.get(script)
+            if parsed is None:
+                return None, set()
+            ops.extend(parsed)
+            ends.add(len(ops) - 1)
+        return ops, ends
+
+    def stack_delta(self, i, op):
+        """Get (pops, pushes) that turn the previous step's stack into the engine's stack.
+
+        Only the topmost items that op can have changed are read from the
+        engine. The engine may replace its whole stack when it finishes a
+        script, so those steps and opcodes that were not parsed are read in full.
+        """
+        prev = self.steps.last_stack
+        dstack = self.engine.dstack
+        depth = dstack.depth()
+        touched = touched_depth(op)
+        if touched is None or self.ops is None or i >= len(self.ops) or i in self.script_ends:
+            kept = 0
+        else:
+            kept = min(max(len(prev) - touched, 0), depth)
+
+        top = [dstack.peek_bytearray(j) for j in range(depth - kept - 1, -1, -1)]
+        # Items that are unchanged are not stored again.
+        common = 0
+        max_common = min(len(prev) - kept, len(top))
+        while common < max_common and prev[kept + common] == top[common]:
+            common += 1
+        return len(prev) - kept - common, top[common:]
+
+    def step(self):
+        """Execute the next opcode.
+
+        Returns the resulting StackState, or None if execution has finished.
+        """
+        if not self.execute_step():
+            return None
+        return StackState(list(self.steps.last_stack), self.last_op, '')
+
+    def execute_step(self):
+        """Execute the next opcode and record it in the trace.
+
+        Returns False if execution has finished.
+        """
+        if self.done:
+            return False
+        if self.max_steps is not None and len(self.steps) >= self.max_steps:
+            return self.stop(LIMIT_STEPS)
+        if self.max_time is not None and self.elapsed >= self.max_time:
+            return self.stop(LIMIT_TIME)
+
+        i = len(self.steps)
+        if self.ops is not None and i < len(self.ops):
+            op = self.ops[i].op
+        else:
+            # Opcodes beyond the parsed scripts (e.g. a P2SH redeem script).
+            op = OpcodeByName.get(self.engine.disasm_pc(verbose=False))
+
+        start = time.time()
+        try:
+            self.done = self.engine.step()
+        except Exception as e:
+            self.error = e
+            self.done = True
+        elapsed = time.time() - start
+        self.elapsed += elapsed
+        if self.profiler is not None:
+            self.profiler.record(op, elapsed, self.engine.dstack.depth())
+
+        pops, pushes = self.stack_delta(i, op)
+        self.steps.append_delta(pops, pushes, op)
+        self.last_op = op
+
+        if self.done and not self.error:
             try:
                 self.engine.check_error_condition(True)
             except Exception as e:
                 self.error = e
+        elif self.max_trace_bytes is not None and self.steps.nbytes > self.max_trace_bytes:
+            self.stop(LIMIT_TRACE_BYTES)
+        return True
+
+    def stop(self, limit):
+        """Stop execution because limit was reached."""
+        self.done = True
+        self.limit_reached = limit
+        return False
+
+    def close(self):
+        """Release the storage used by the trace."""
+        self.steps.close()
+
+    def run(self):
+        """Execute all remaining opcodes."""
+        while self.execute_step():
+            pass
 
     def __iter__(self):
         i = 0
+        while i < len(self.steps) or self.execute_step():
+            yield self.steps[i]
+            i += 1
         # Raise no error for "Script did not pass"
         if self.error and str(self.error) != 'execute fail, fail on stack':
             raise self.error
-        while i < len(self.steps):
-            yield self.steps[i]
-            i += 1
-
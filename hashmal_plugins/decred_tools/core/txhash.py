@@ -0,0 +1,97 @@
+"""Decred transaction hashes.
+
+A transaction's hash (its txid) is the BLAKE-256 hash of its prefix
+serialization, and its witness hash is the hash of its witness-only
+serialization. Each hash is memoized on the transaction, and setting a
+field of its inputs, outputs or prevouts discards only the hash of the
+section that the field is serialized in. Changes to the transaction's
+own fields, or to which inputs and outputs it has, are found by comparing
+its layout, so nothing is serialized to check whether a hash is current.
+The layout holds the inputs and outputs themselves and compares them by
+identity, since the id of a removed item may be reused by a new one.
+"""
+from bitcoin.core import b2lx
+
+from .blake256 import blake256
+from . import wire
+
+class SectionMemo(object):
+    """Memoized section hashes of a transaction.
+
+    hashes maps each serialization type to a tuple of (layout, hash).
+    """
+    def __init__(self):
+        self.hashes = {}
+
+    def discard(self, ser_type):
+        self.hashes.pop(ser_type, None)
+
+    def untrack(self):
+        self.hashes.clear()
+
+def _layout(tx, ser_type):
+    """Get the transaction-level values and items that the section ser_type depends on.
+
+    Returns:
+        A tuple of (values, items).
+    """
+    if ser_type == wire.TX_SER_ONLY_WITNESS:
+        return ((tx.nVersion,), tuple(tx.vin))
+    return ((tx.nVersion, tx.nLockTime, tx.expiry, len(tx.vin)), tuple(tx.vin) + tuple(tx.vout))
+
+def _same_layout(a, b):
+    return a[0] == b[0] and len(a[1]) == len(b[1]) and all(i is j for i, j in zip(a[1], b[1]))
+
+def _track(tx, memo):
+    """Add memo to the inputs and outputs of tx.
+
+    Returns False if any of them cannot be tracked.
+    """
+    tracked = True
+    for item in list(tx.vin) + list(tx.vout):
+        if not isinstance(item, wire.TrackedFields) or not item.add_memo(memo):
+            tracked = False
+    return tracked
+
+def invalidate(tx):
+    """Discard the memoized hashes of tx.
+
+    This is only needed after changing a field without setting it, such
+    as modifying a script in place.
+    """
+    memo = getattr(tx, '_section_memo', None)
+    if memo is not None:
+        memo.hashes.clear()
+
+def section_hash(tx, ser_type):
+    """Get the hash of tx serialized with ser_type."""
+    layout = _layout(tx, ser_type)
+    memo = getattr(tx, '_section_memo', None)
+    if memo is None:
+        memo = SectionMemo()
+        tx._section_memo = memo
+    else:
+        cached = memo.hashes.get(ser_type)
+        if cached is not None and _same_layout(cached[0], layout):
+            return cached[1]
+
+    memo.discard(ser_type)
+    tracked = _track(tx, memo)
+    h = blake256(wire.serialize_tx(tx, ser_type))
+    if tracked:
+        memo.hashes[ser_type] = (layout, h)
+    return h
+
+def prefix_hash(tx):
+    return section_hash(tx, wire.TX_SER_NO_WITNESS)
+
+def witness_hash(tx):
+    return section_hash(tx, wire.TX_SER_ONLY_WITNESS)
+
+def full_hash(tx):
+    """Get the hash of tx that commits to both its prefix and its witness."""
+    return blake256(prefix_hash(tx) + witness_hash(tx))
+
+def txid(tx):
+    """Get the txid of tx as a hex string."""
+    return b2lx(prefix_hash(tx))
@@ -0,0 +1,413 @@
+"""Decred wire format.
+
+Transactions are read straight into hashmal_lib objects and written
+back from them in a single pass, without building an intermediate
+decred.core transaction.
+
+Besides full serializations, prefix-only and witness-only serializations
+are supported. The witness of a full serialization can be decoded lazily,
+in which case it is only parsed once one of its fields is read.
+"""
+import struct
+from io import BytesIO
+
+from bitcoin.core.serialize import (ser_read, SerializationError, SerializationTruncationError,
+            VarIntSerializer, BytesSerializer)
+
+from hashmal_lib.core.transaction import OutPoint, TxIn, TxOut
+
+# Serialization types (upper 16 bits of the serialized version).
+TX_SER_FULL = 0
+TX_SER_NO_WITNESS = 1
+TX_SER_ONLY_WITNESS = 2
+
+ser_types = [TX_SER_FULL, TX_SER_NO_WITNESS, TX_SER_ONLY_WITNESS]
+
+_uint8 = struct.Struct(b'<B')
+_uint16 = struct.Struct(b'<H')
+_uint32 = struct.Struct(b'<I')
+_uint64 = struct.Struct(b'<Q')
+# Prevout (hash, n, tree) followed by nSequence.
+_txin_prefix = struct.Struct(b'<32sIbI')
+# nValue and version.
+_txout_header = struct.Struct(b'<qH')
+# value, block_height and block_index.
+_txin_witness = struct.Struct(b'<qII')
+# nLockTime and expiry.
+_tx_footer = struct.Struct(b'<II')
+
+def read_varint_at(buf, offset):
+    """Read a compact size integer from buf at offset.
+
+    Returns a tuple of (value, offset after the integer).
+    """
+    n = _uint8.unpack_from(buf, offset)[0]
+    if n < 0xfd:
+        return n, offset + 1
+    elif n == 0xfd:
+        return _uint16.unpack_from(buf, offset + 1)[0], offset + 3
+    elif n == 0xfe:
+        return _uint32.unpack_from(buf, offset + 1)[0], offset + 5
+    return _uint64.unpack_from(buf, offset + 1)[0], offset + 9
+
+def tx_sections_at(buf, offset):
+    """Find the sections of the serialized transaction at offset in buf.
+
+    Only lengths are read, so no objects are created for the transaction.
+
+    Returns a tuple of (serialization type, end of prefix, end of transaction).
+    """
+    try:
+        ser_type = _uint32.unpack_from(buf, offset)[0] >> 16
+        if ser_type not in ser_types:
+            raise SerializationError('Unsupported transaction serialization type: %d' % ser_type)
+        offset += 4
+        if ser_type != TX_SER_ONLY_WITNESS:
+            count, offset = read_varint_at(buf, offset)
+            offset += count * _txin_prefix.size
+            count, offset = read_varint_at(buf, offset)
+            for _ in range(count):
+                length, offset = read_varint_at(buf, offset + _txout_header.size)
+                offset += length
+            offset += _tx_footer.size
+        prefix_end = offset
+        if ser_type != TX_SER_NO_WITNESS:
+            count, offset = read_varint_at(buf, offset)
+            for _ in range(count):
+                length, offset = read_varint_at(buf, offset + _txin_witness.size)
+                offset += length
+    except struct.error:
+        raise SerializationTruncationError('Transaction data is truncated')
+    if offset > len(buf):
+        raise SerializationTruncationError('Transaction data is truncated')
+    return ser_type, prefix_end, offset
+
+def tx_end_at(buf, offset):
+    """Find where the serialized transaction at offset in buf ends."""
+    return tx_sections_at(buf, offset)[2]
+
+def prefix_serialization(raw_tx):
+    """Get the prefix-only serialization of a serialized transaction."""
+    ser_type, prefix_end, _ = tx_sections_at(raw_tx, 0)
+    if ser_type == TX_SER_ONLY_WITNESS:
+        raise SerializationError('Transaction has no prefix')
+    version = _uint32.unpack_from(raw_tx, 0)[0] & 0xffff
+    return _uint32.pack(version | (TX_SER_NO_WITNESS << 16)) + raw_tx[4:prefix_end]
+
+class StreamCursor(object):
+    """Reads serialized fields from a file-like object."""
+    def __init__(self, f):
+        self.f = f
+
+    def unpack(self, st):
+        return st.unpack(ser_read(self.f, st.size))
+
+    def varint(self):
+        return VarIntSerializer.stream_deserialize(self.f)
+
+    def read(self, n):
+        return ser_read(self.f, n)
+
+    def skip(self, n):
+        self.f.seek(n, 1)
+
+    def position(self):
+        return self.f.tell()
+
+    def slice(self, start, end):
+        """Read the bytes between two positions, leaving the cursor at end."""
+        self.f.seek(start)
+        return ser_read(self.f, end - start)
+
+class BufferCursor(object):
+    """Reads serialized fields in place from a buffer.
+
+    Fixed-size fields are unpacked directly from the buffer. Only
+    variable-length data (scripts and raw witnesses) is copied out.
+    """
+    def __init__(self, buf, start=0, end=None):
+        self.buf = buf
+        self.start = start
+        self.end = len(buf) if end is None else end
+        self.pos = start
+
+    def _advance(self, n):
+        pos = self.pos
+        if pos + n > self.end:
+            raise SerializationTruncationError('Asked to read %d bytes, but only %d remain' % (n, self.end - pos))
+        self.pos = pos + n
+        return pos
+
+    def unpack(self, st):
+        return st.unpack_from(self.buf, self._advance(st.size))
+
+    def varint(self):
+        try:
+            value, end = read_varint_at(self.buf, self.pos)
+        except struct.error:
+            raise SerializationTruncationError('Varint is truncated')
+        self._advance(end - self.pos)
+        return value
+
+    def read(self, n):
+        pos = self._advance(n)
+        return self.buf[pos:pos + n]
+
+    def skip(self, n):
+        self._advance(n)
+
+    def position(self):
+        return self.pos
+
+    def slice(self, start, end):
+        self.pos = end
+        return self.buf[start:end]
+
+def cursor_for(f):
+    """Get a cursor for reading from f."""
+    return f if isinstance(f, BufferCursor) else StreamCursor(f)
+
+def read_prefix(cursor):
+    """Read a transaction prefix.
+
+    Returns a tuple of (prevouts, vout, nLockTime, expiry), where prevouts
+    is a list of (OutPoint, nSequence) tuples.
+    """
+    prevouts = []
+    for _ in range(cursor.varint()):
+        h, n, tree, sequence = cursor.unpack(_txin_prefix)
+        prevouts.append((DecredOutPoint(hash=h, n=n, kwfields={'tree': tree}), sequence))
+
+    vout = []
+    for _ in range(cursor.varint()):
+        value, version = cursor.unpack(_txout_header)
+        script = cursor.read(cursor.varint())
+        vout.append(DecredTxOut(nValue=value, scriptPubKey=script, kwfields={'version': version}))
+
+    locktime, expiry = cursor.unpack(_tx_footer)
+    return prevouts, vout, locktime, expiry
+
+def read_witness(cursor):
+    """Read a transaction witness.
+
+    Returns a list of (value, block_height, block_index, scriptSig) tuples.
+    """
+    witnesses = []
+    for _ in range(cursor.varint()):
+        value, height, index = cursor.unpack(_txin_witness)
+        script = cursor.read(cursor.varint())
+        witnesses.append((value, height, index, script))
+    return witnesses
+
+def skip_witness(cursor):
+    """Read the raw bytes of a transaction witness without parsing it."""
+    start = cursor.position()
+    for _ in range(cursor.varint()):
+        cursor.skip(_txin_witness.size)
+        cursor.skip(cursor.varint())
+    return cursor.slice(start, cursor.position())
+
+class TrackedFields(object):
+    """Mixin that tells hash memos when a serialized field is set.
+
+    Each memo added with add_memo() has discard(ser_type) called with the
+    serialization section that the field is written to. If a child object
+    that cannot be tracked is assigned, the memo's untrack() is called.
+    """
+    # {attribute: serialization type of the section it is written to}
+    sections = {}
+    # Attributes holding objects whose own fields are serialized.
+    children = ()
+
+    def __setattr__(self, name, value):
+        super(TrackedFields, self).__setattr__(name, value)
+        ser_type = self.sections.get(name)
+        memos = getattr(self, '_memos', None)
+        if ser_type is None or not memos:
+            return
+        for memo in memos:
+            memo.discard(ser_type)
+            if name in self.children:
+                if isinstance(value, TrackedFields):
+                    value.add_memo(memo)
+                else:
+                    memo.untrack()
+
+    def add_memo(self, memo):
+        """Add memo to this object and its children.
+
+        Returns False if a child cannot be tracked.
+        """
+        memos = getattr(self, '_memos', None)
+        if memos is None:
+            memos = []
+            self._memos = memos
+        if memo not in memos:
+            memos.append(memo)
+        for name in self.children:
+            child = getattr(self, name)
+            if not isinstance(child, TrackedFields) or not child.add_memo(memo):
+                return False
+        return True
+
+    def remove_memo(self, memo):
+        memos = getattr(self, '_memos', None)
+        if memos and memo in memos:
+            memos.remove(memo)
+        for name in self.children:
+            child = getattr(self, name)
+            if isinstance(child, TrackedFields):
+                child.remove_memo(memo)
+
+class DecredOutPoint(TrackedFields, OutPoint):
+    sections = dict.fromkeys(['hash', 'n', 'tree'], TX_SER_NO_WITNESS)
+
+class DecredTxIn(TrackedFields, TxIn):
+    sections = dict.fromkeys(['prevout', 'nSequence'], TX_SER_NO_WITNESS)
+    sections.update(dict.fromkeys(['value', 'block_height', 'block_index', 'scriptSig'], TX_SER_ONLY_WITNESS))
+    children = ('prevout',)
+
+class DecredTxOut(TrackedFields, TxOut):
+    sections = dict.fromkeys(['nValue', 'version', 'scriptPubKey'], TX_SER_NO_WITNESS)
+
+def make_txin(prevout, sequence, witness):
+    value, height, index, script = witness
+    kwargs = {'value': value, 'block_height': height, 'block_index': index}
+    return DecredTxIn(prevout=prevout, scriptSig=script, nSequence=sequence, kwfields=kwargs)
+
+class LazyWitness(object):
+    """Undecoded witness data shared by the inputs of a transaction."""
+    def __init__(self, data, txins):
+        self.data = data
+        self.txins = txins
+
+    def load(self):
+        """Decode the witness data into its inputs."""
+        witnesses = read_witness(BufferCursor(self.data))
+        if len(witnesses) != len(self.txins):
+            raise SerializationError('Witness count (%d) does not match input count (%d)' % (len(witnesses), len(self.txins)))
+        for txin, (value, height, index, script) in zip(self.txins, witnesses):
+            txin._pending_witness = None
+            txin._value, txin._block_height, txin._block_index, txin._scriptSig = value, height, index, script
+
+def _witness_property(attr):
+    name = '_' + attr
+    def fget(self):
+        pending = getattr(self, '_pending_witness', None)
+        if pending is not None:
+            pending.load()
+        return getattr(self, name)
+
+    def fset(self, value):
+        pending = getattr(self, '_pending_witness', None)
+        if pending is not None:
+            pending.load()
+        setattr(self, name, value)
+    return property(fget, fset)
+
+class LazyTxIn(DecredTxIn):
+    """TxIn whose witness fields are decoded when first accessed."""
+    value = _witness_property('value')
+    block_height = _witness_property('block_height')
+    block_index = _witness_property('block_index')
+    scriptSig = _witness_property('scriptSig')
+
+def make_lazy_vin(prevouts, witness_data):
+    vin = []
+    for prevout, sequence in prevouts:
+        kwargs = {'value': 0, 'block_height': 0, 'block_index': 0}
+        vin.append(LazyTxIn(prevout=prevout, scriptSig=b'', nSequence=sequence, kwfields=kwargs))
+    witness = LazyWitness(witness_data, vin)
+    for txin in vin:
+        txin._pending_witness = witness
+    return vin
+
+def pending_witness(tx):
+    """Get the undecoded witness that tx's inputs share, if any."""
+    if not tx.vin:
+        return None
+    pending = getattr(tx.vin[0], '_pending_witness', None)
+    if pending is None or len(pending.txins) != len(tx.vin):
+        return None
+    if any(getattr(i, '_pending_witness', None) is not pending for i in tx.vin):
+        return None
+    return pending
+
+def stream_deserialize_tx(f, lazy_witness=False):
+    """Deserialize a transaction from f.
+
+    If lazy_witness is True, the witness of a full serialization is
+    decoded only when one of its fields is accessed.
+
+    If f is a BufferCursor, the transaction is read in place.
+
+    Returns a dict of transaction fields.
+    """
+    f = cursor_for(f)
+    version = f.unpack(_uint32)[0]
+    ser_type = version >> 16
+    if ser_type not in ser_types:
+        raise SerializationError('Unsupported transaction serialization type: %d' % ser_type)
+
+    prevouts, vout, locktime, expiry = [], [], 0, 0
+    if ser_type != TX_SER_ONLY_WITNESS:
+        prevouts, vout, locktime, expiry = read_prefix(f)
+
+    if ser_type == TX_SER_NO_WITNESS:
+        vin = [make_txin(p, s, (0, 0, 0, b'')) for p, s in prevouts]
+    elif ser_type == TX_SER_ONLY_WITNESS:
+        vin = [make_txin(DecredOutPoint(kwfields={'tree': 0}), 0xffffffff, w) for w in read_witness(f)]
+    elif lazy_witness:
+        vin = make_lazy_vin(prevouts, skip_witness(f))
+    else:
+        witnesses = read_witness(f)
+        if len(witnesses) != len(prevouts):
+            raise SerializationError('Witness count (%d) does not match input count (%d)' % (len(witnesses), len(prevouts)))
+        vin = [make_txin(p, s, w) for (p, s), w in zip(prevouts, witnesses)]
+
+    return {
+        'nVersion': version & 0xffff,
+        'vin': vin,
+        'vout': vout,
+        'nLockTime': locktime,
+        'expiry': expiry,
+    }
+
+def write_prefix(tx, f):
+    VarIntSerializer.stream_serialize(len(tx.vin), f)
+    for i in tx.vin:
+        f.write(_txin_prefix.pack(i.prevout.hash, i.prevout.n, i.prevout.tree, i.nSequence))
+
+    VarIntSerializer.stream_serialize(len(tx.vout), f)
+    for o in tx.vout:
+        f.write(_txout_header.pack(o.nValue, o.version))
+        BytesSerializer.stream_serialize(o.scriptPubKey, f)
+
+    f.write(_tx_footer.pack(tx.nLockTime, tx.expiry))
+
+def write_witness(tx, f):
+    # Witness data that was never decoded is written back as-is.
+    pending = pending_witness(tx)
+    if pending is not None:
+        return f.write(pending.data)
+
+    VarIntSerializer.stream_serialize(len(tx.vin), f)
+    for i in tx.vin:
+        f.write(_txin_witness.pack(i.value, i.block_height, i.block_index))
+        BytesSerializer.stream_serialize(i.scriptSig, f)
+
+def stream_serialize_tx(tx, f, ser_type=TX_SER_FULL):
+    """Serialize tx to f using the given serialization type."""
+    if ser_type not in ser_types:
+        raise SerializationError('Unsupported transaction serialization type: %d' % ser_type)
+    f.write(_uint32.pack((tx.nVersion & 0xffff) | (ser_type << 16)))
+    if ser_type != TX_SER_ONLY_WITNESS:
+        write_prefix(tx, f)
+    if ser_type != TX_SER_NO_WITNESS:
+        write_witness(tx, f)
+
+def serialize_tx(tx, ser_type=TX_SER_FULL):
+    """Serialize tx using the given serialization type."""
+    f = BytesIO()
+    stream_serialize_tx(tx, f, ser_type)
+    return f.getvalue()
@@ -1,24 +1,39 @@
 from __future__ import absolute_import
 
-from decred.core.script import opcode
-from decred.core import transaction
+from collections import namedtuple
+import functools
+from io import BytesIO
+
+from bitcoin.core import b2lx
+from bitcoin.core.serialize import DeserializationExtraDataError
 
 from hashmal_lib import plugins
 from hashmal_lib.plugins import BasePluginUI, Plugin, augmenter
 from hashmal_lib.core import chainparams
 from hashmal_lib.core.serialize import *
-from hashmal_lib.core.transaction import TransactionSerializer, OutPoint, TxIn, TxOut
+from hashmal_lib.core.transaction import Transaction, TransactionSerializer
+
+from hashmal_plugins import workers
+
+from .core import txhash, wire
+from .core.opcodes import op_names, ops_by_name, disabled_ops
 
-from .core.stack import DecredEngine
+class DecredParamsPreset(chainparams.ParamsPreset):
+    """Preset whose script engine class is imported when it is first used.
 
-op_names = {}
-ops_by_name = {}
-disabled_ops = []
-for op in opcode.opcodeArray:
-    op_names[op.value] = op.name
-    ops_by_name[op.name] = op.value
-    if opcode.ParsedOpcode(op, b'').isDisabled():
-        disabled_ops.append(op.value)
+    The engine module (and the decred script package it depends on) is only
+    imported when script_engine_cls is read, and the attribute is the engine
+    class itself, so it can be subclassed and used with isinstance().
+    """
+    @property
+    def script_engine_cls(self):
+        from .core.stack import DecredEngine
+        return DecredEngine
+
+    @script_engine_cls.setter
+    def script_engine_cls(self, value):
+        # The engine class is always the one imported above.
+        pass
 
 dcr_header_fields = [
     Field('nVersion', b'<i', 4, 1),
@@ -93,71 +108,75 @@ dcr_builder_help = {
     }
 }
 
+class LazyWitnessStream(BytesIO):
+    """Stream whose transactions' witnesses are only decoded once one of their fields is read."""
+    lazy_witness = True
+
 class DecredTxSerializer(TransactionSerializer):
     def stream_deserialize(self, tx, f):
-        dtx = transaction.Transaction.stream_deserialize(f)
-        vin = []
-        for din in dtx.txins:
-            pout_hash = din.prev_out.hash
-            pout_n = din.prev_out.index
-            pout_kwargs = {'tree': din.prev_out.tree}
-            prevout = OutPoint(hash=pout_hash, n=pout_n, kwfields=pout_kwargs)
-
-            txi_sequence = din.sequence
-            txi_script = din.sig_script
-
-            txi_value = din.value
-            txi_height = din.block_height
-            txi_index = din.block_index
-            txi_kwargs = {'value': txi_value, 'block_height': txi_height, 'block_index': txi_index}
-            txin = TxIn(prevout=prevout, scriptSig=txi_script, nSequence=txi_sequence, kwfields=txi_kwargs)
-            vin.append(txin)
-
-        vout = []
-        for do in dtx.txouts:
-            txo_val = do.value
-            txo_version = do.version
-            txo_script = do.pk_script
-            txo_kwargs = {'version': txo_version}
-            txout = TxOut(nValue=txo_val, scriptPubKey=txo_script, kwfields=txo_kwargs)
-            vout.append(txout)
-
-        kwargs = {
-            'nVersion': dtx.version,
-            'vin': vin,
-            'vout': vout,
-            'nLockTime': dtx.locktime,
-            'expiry': dtx.expiry,
-        }
-        return kwargs
+        return wire.stream_deserialize_tx(f, getattr(f, 'lazy_witness', False))
 
     def stream_serialize(self, tx, f):
-        txins = []
-        for i in tx.vin:
-            po = transaction.OutPoint(i.prevout.hash, i.prevout.n, i.prevout.tree)
-            txin = transaction.TxIn(prev_out=po, sequence=i.nSequence, value=i.value,
-                        block_height=i.block_height, block_index=i.block_index,
-                        sig_script=i.scriptSig)
-            txins.append(txin)
-
-        txouts = []
-        for o in tx.vout:
-            txout = transaction.TxOut(value=o.nValue, version=o.version, pk_script=o.scriptPubKey)
-            txouts.append(txout)
-
-        kwargs = {
-            'version': tx.nVersion,
-            'txins': txins,
-            'txouts': txouts,
-            'locktime': tx.nLockTime,
-            'expiry': tx.expiry,
-        }
-        dtx = transaction.Transaction(**kwargs)
-        return dtx.stream_serialize(f)
-
-DecredPreset = chainparams.ParamsPreset(
+        return wire.stream_serialize_tx(tx, f)
+
+TxSummary = namedtuple('TxSummary', ('txid', 'nVersion', 'num_inputs', 'num_outputs', 'value_out', 'nLockTime', 'expiry', 'size', 'witness_hash'))
+
+class TxFields(object):
+    """Decoded transaction fields that can be hashed with txhash."""
+    def __init__(self, fields):
+        self.__dict__.update(fields)
+
+def deserialize_tx(raw_tx, lazy_witness=False):
+    """Deserialize a raw transaction with the Decred preset.
+
+    If lazy_witness is True, the witness is only decoded once one of its
+    fields is read.
+    """
+    if not lazy_witness:
+        return Transaction.deserialize(raw_tx)
+    f = LazyWitnessStream(raw_tx)
+    tx = Transaction.stream_deserialize(f)
+    padding = f.read()
+    if padding:
+        raise DeserializationExtraDataError('Not all bytes consumed during deserialization', tx, padding)
+    return tx
+
+def summarize_tx(raw_tx, lazy_witness=True):
+    """Summarize a raw transaction, by default without decoding its witness."""
+    tx = TxFields(wire.stream_deserialize_tx(wire.BufferCursor(raw_tx), lazy_witness))
+    value_out = sum(o.nValue for o in tx.vout)
+    return TxSummary(txhash.txid(tx), tx.nVersion, len(tx.vin), len(tx.vout), value_out,
+                     tx.nLockTime, tx.expiry, len(raw_tx), b2lx(txhash.witness_hash(tx)))
+
+def _activate_preset():
+    """Make Decred the active chainparams preset in a worker process."""
+    chainparams.add_preset(DecredPreset)
+    chainparams.set_to_preset(DecredPreset.name)
+
+def deserialize_many(raw_txs, summaries=False, processes=None, chunksize=64, lazy_witness=False):
+    """Deserialize raw transactions across a pool of processes.
+
+    Workers deserialize with the Decred preset regardless of the preset
+    that is active in the current process.
+
+    Args:
+        raw_txs (iterable): Serialized transactions.
+        summaries (bool): Whether to return TxSummary tuples instead of Transactions.
+        processes (int): Number of worker processes. Defaults to the number of CPUs.
+            If 1, transactions are deserialized in the current process, where
+            the Decred preset must be active.
+        chunksize (int): Number of transactions sent to a worker at a time.
+        lazy_witness (bool): Whether witnesses are only decoded once one of
+            their fields is read. Summaries never decode witnesses.
+
+    Returns:
+        A list of results in the same order as raw_txs.
+    """
+    func = summarize_tx if summaries else functools.partial(deserialize_tx, lazy_witness=lazy_witness)
+    return list(workers.imap(func, raw_txs, processes, chunksize, initializer=_activate_preset))
+
+DecredPreset = DecredParamsPreset(
         name='Decred',
-        script_engine_cls = DecredEngine,
         opcode_names = op_names,
         opcodes_by_name = ops_by_name,
         disabled_opcodes = disabled_ops,
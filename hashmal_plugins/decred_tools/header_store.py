@@ -0,0 +1,147 @@
+"""Persistent store of Decred block headers."""
+from __future__ import absolute_import
+
+import mmap
+import os
+
+from .blocks import header_struct, DecredHeader
+from .core.blake256 import blake256
+
+HASH_SIZE = 32
+
+class HeaderStore(object):
+    """Append-only store of Decred block headers.
+
+    Headers are kept as fixed-size records in <path>.dat, and their hashes
+    are kept in the same order in <path>.idx. Records are read through a
+    memory mapping, and a hash-to-height index is built from the hashes
+    when the store is opened.
+
+    Headers must be appended in chain order.
+    """
+    record_size = header_struct.size
+
+    def __init__(self, path):
+        self.data_path = path + '.dat'
+        self.index_path = path + '.idx'
+        self.data_file = open(self.data_path, 'ab')
+        self.index_file = open(self.index_path, 'ab')
+        self.mapping = None
+        self.mapped_count = 0
+        self.count = os.path.getsize(self.data_path) // self.record_size
+        # Drop any partially written record.
+        self.data_file.truncate(self.count * self.record_size)
+        self.heights = {}
+        self.base_height = 0
+        self.tip_hash = None
+        self.load_index()
+
+    def load_index(self):
+        with open(self.index_path, 'rb') as f:
+            hashes = f.read(self.count * HASH_SIZE)
+        indexed = len(hashes) // HASH_SIZE
+        for i in range(indexed):
+            self.heights[hashes[i * HASH_SIZE:(i + 1) * HASH_SIZE]] = i
+
+        # Index any records whose hashes were not written.
+        self.index_file.truncate(indexed * HASH_SIZE)
+        for i in range(indexed, self.count):
+            block_hash = blake256(self.get_raw_record(i))
+            self.index_file.write(block_hash)
+            self.heights[block_hash] = i
+        self.index_file.flush()
+
+        if self.count:
+            self.base_height = self.get_record(0).nHeight
+            self.tip_hash = blake256(self.get_raw_record(self.count - 1))
+
+    def close(self):
+        if self.mapping is not None:
+            self.mapping.close()
+            self.mapping = None
+        self.data_file.close()
+        self.index_file.close()
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, block_hash):
+        return block_hash in self.heights
+
+    def remap(self):
+        if self.mapping is not None:
+            self.mapping.close()
+        with open(self.data_path, 'rb') as f:
+            self.mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.mapped_count = len(self.mapping) // self.record_size
+
+    def get_raw_record(self, i):
+        if i >= self.mapped_count:
+            self.remap()
+        start = i * self.record_size
+        return self.mapping[start:start + self.record_size]
+
+    def get_record(self, i):
+        if i >= self.mapped_count:
+            self.remap()
+        return DecredHeader._make(header_struct.unpack_from(self.mapping, i * self.record_size))
+
+    @property
+    def tip_height(self):
+        """Height of the last header, or None if the store is empty."""
+        return self.base_height + self.count - 1 if self.count else None
+
+    def append(self, raw_header):
+        """Append a serialized header.
+
+        Returns the header's hash.
+        """
+        if len(raw_header) != self.record_size:
+            raise ValueError('Header must be %d bytes.' % self.record_size)
+        header = DecredHeader._make(header_struct.unpack(raw_header))
+        if self.count:
+            if header.hashPrevBlock != self.tip_hash:
+                raise ValueError('Header does not extend the tip of the store.')
+            if header.nHeight != self.tip_height + 1:
+                raise ValueError('Header height %d does not follow the tip height %d.' % (header.nHeight, self.tip_height))
+        else:
+            self.base_height = header.nHeight
+
+        block_hash = blake256(raw_header)
+        # Records are written first so that a missing hash can be recomputed.
+        self.data_file.write(raw_header)
+        self.data_file.flush()
+        self.index_file.write(block_hash)
+        self.index_file.flush()
+        self.heights[block_hash] = self.count
+        self.count += 1
+        self.tip_hash = block_hash
+        return block_hash
+
+    def extend(self, raw_headers):
+        for raw_header in raw_headers:
+            self.append(raw_header)
+
+    def height_of(self, block_hash):
+        """Get the height of the header with block_hash, or None if it is not stored."""
+        i = self.heights.get(block_hash)
+        return None if i is None else self.base_height + i
+
+    def get_raw_header(self, height):
+        """Get the serialized header at height, or None if it is not stored."""
+        i = height - self.base_height
+        if not 0 <= i < self.count:
+            return None
+        return self.get_raw_record(i)
+
+    def get_header(self, height):
+        """Get the header at height, or None if it is not stored."""
+        i = height - self.base_height
+        if not 0 <= i < self.count:
+            return None
+        return self.get_record(i)
+
+    def get_header_by_hash(self, block_hash):
+        """Get the header with block_hash, or None if it is not stored."""
+        i = self.heights.get(block_hash)
+        return None if i is None else self.get_record(i)
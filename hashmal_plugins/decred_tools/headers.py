@@ -0,0 +1,104 @@
+"""Bulk access to files of raw Decred block headers.
+
+A headers file (consecutive serialized headers) is memory-mapped as a NumPy
+structured array whose dtype is derived from dcr_header_fields, so each
+header field can be read as a column, e.g. headers['nHeight'].
+
+NumPy is an optional dependency, installed with the "headers" extra.
+"""
+from __future__ import absolute_import
+
+import os
+
+try:
+    import numpy as np
+except ImportError:
+    raise ImportError('decred_tools.headers requires NumPy. Install it with "pip install numpy".')
+
+from .core import blake256
+from .hashmal_decred import dcr_header_fields
+
+def fields_dtype(fields):
+    """Build a NumPy structured dtype for a list of fixed-size fields."""
+    items = []
+    for field in fields:
+        if field.fmt in ['hash', 'bytes']:
+            items.append((str(field.attr), np.uint8, (field.num_bytes,)))
+            continue
+        dtype = np.dtype(field.fmt)
+        if dtype.itemsize != field.num_bytes:
+            raise ValueError('Field %s is not %d bytes' % (field.attr, field.num_bytes))
+        items.append((str(field.attr), dtype))
+    return np.dtype(items)
+
+header_dtype = fields_dtype(dcr_header_fields)
+
+def load_headers(path):
+    """Map a file of raw headers onto an array of header_dtype."""
+    if not os.path.getsize(path):
+        return np.zeros(0, dtype=header_dtype)
+    return np.memmap(path, dtype=header_dtype, mode='r')
+
+_C = [np.uint32(i) for i in blake256.C]
+
+def _rotr(x, n):
+    return (x >> n) | (x << (32 - n))
+
+def _compress_many(h, m, t):
+    """BLAKE-256 compression of one block for every row of m."""
+    v = list(h) + [np.full_like(h[0], i) for i in blake256.C[:4]]
+    v += [np.full_like(h[0], (t & blake256.MASK) ^ blake256.C[4]),
+          np.full_like(h[0], (t & blake256.MASK) ^ blake256.C[5]),
+          np.full_like(h[0], (t >> 32) ^ blake256.C[6]),
+          np.full_like(h[0], (t >> 32) ^ blake256.C[7])]
+    for r in range(blake256.ROUNDS):
+        s = blake256.SIGMA[r % 10]
+        for i, (a, b, c, d) in enumerate(blake256.G_INDEXES):
+            x, y = s[2 * i], s[2 * i + 1]
+            v[a] = v[a] + v[b] + (m[x] ^ _C[y])
+            v[d] = _rotr(v[d] ^ v[a], 16)
+            v[c] = v[c] + v[d]
+            v[b] = _rotr(v[b] ^ v[c], 12)
+            v[a] = v[a] + v[b] + (m[y] ^ _C[x])
+            v[d] = _rotr(v[d] ^ v[a], 8)
+            v[c] = v[c] + v[d]
+            v[b] = _rotr(v[b] ^ v[c], 7)
+    return [h[i] ^ v[i] ^ v[i + 8] for i in range(8)]
+
+def header_hashes(headers, chunk_size=65536):
+    """Compute the BLAKE-256 hashes of an array of headers.
+
+    All headers are hashed at once, a chunk at a time.
+
+    Returns an array of shape (len(headers), 32).
+    """
+    size = header_dtype.itemsize
+    padded_size, counters = blake256.pad(b'\x00' * size)
+    tail = np.frombuffer(padded_size[size:], dtype=np.uint8)
+    result = np.zeros((len(headers), 32), dtype=np.uint8)
+
+    for start in range(0, len(headers), chunk_size):
+        chunk = np.ascontiguousarray(headers[start:start + chunk_size])
+        n = len(chunk)
+        padded = np.empty((n, len(padded_size)), dtype=np.uint8)
+        padded[:, :size] = chunk.view(np.uint8).reshape(n, size)
+        padded[:, size:] = tail
+        words = padded.view('>u4').astype(np.uint32)
+
+        h = [np.full(n, i, dtype=np.uint32) for i in blake256.IV]
+        for block, t in enumerate(counters):
+            m = [words[:, block * 16 + j] for j in range(16)]
+            h = _compress_many(h, m, t)
+        digests = np.stack(h, axis=1).astype('>u4')
+        result[start:start + n] = digests.view(np.uint8).reshape(n, 32)
+    return result
+
+def validate_chain(headers, hashes=None):
+    """Check that each header refers to the hash of the header before it.
+
+    Returns the indexes of headers whose hashPrevBlock does not match.
+    """
+    if hashes is None:
+        hashes = header_hashes(headers)
+    linked = np.all(headers['hashPrevBlock'][1:] == hashes[:-1], axis=1)
+    return np.nonzero(~linked)[0] + 1
@@ -0,0 +1,58 @@
+"""Plugin entry points.
+
+The plugin entry points refer to the factories in this module, so that
+Hashmal can discover the plugins without importing them. A plugin's
+implementation module is imported when its factory is first called, and
+the time the import took is recorded for import_report(). Costly
+libraries are imported by the plugins when they are first used.
+"""
+from collections import namedtuple, OrderedDict
+import importlib
+import sys
+import time
+
+PluginDescriptor = namedtuple('PluginDescriptor', ('name', 'module'))
+
+descriptors = OrderedDict((i.name, i) for i in [
+    PluginDescriptor('Base58 Tools', 'hashmal_plugins.base58_tools.base58_tools'),
+    PluginDescriptor('Coin Claimer', 'hashmal_plugins.coin_claimer.coin_claimer'),
+    PluginDescriptor('Coin Codex', 'hashmal_plugins.coin_codex.coin_codex'),
+    PluginDescriptor('Decred', 'hashmal_plugins.decred_tools.hashmal_decred'),
+    PluginDescriptor('Pycoin', 'hashmal_plugins.pycoin.hashmal_pycoin'),
+])
+
+# {plugin name: seconds taken to import its module}
+import_times = {}
+
+def load_module(name):
+    """Import the implementation module of the plugin called name."""
+    module_name = descriptors[name].module
+    module = sys.modules.get(module_name)
+    if module is None:
+        start = time.time()
+        module = importlib.import_module(module_name)
+        import_times[name] = time.time() - start
+    return module
+
+def make_plugin(name):
+    return load_module(name).make_plugin()
+
+def plugin_factory(name):
+    """Create an entry point function for the plugin called name."""
+    def factory():
+        return make_plugin(name)
+    factory.__doc__ = 'Load the %s plugin.' % name
+    return factory
+
+make_base58_tools = plugin_factory('Base58 Tools')
+make_coin_claimer = plugin_factory('Coin Claimer')
+make_coin_codex = plugin_factory('Coin Codex')
+make_decred = plugin_factory('Decred')
+make_pycoin = plugin_factory('Pycoin')
+
+def import_report():
+    """Get a list of (plugin name, import time) tuples.
+
+    The import time is in seconds, or None if the plugin has not been loaded.
+    """
+    return [(name, import_times.get(name)) for name in descriptors.keys()]
@@ -1 +0,0 @@
-import hashmal_pycoin
@@ -1,6 +1,4 @@
 from bitcoin.core import x, lx, b2x, b2lx
-import pycoin
-from pycoin.key.BIP32Node import BIP32Node
 
 from PyQt4.QtGui import *
 from PyQt4.QtCore import *
@@ -14,12 +12,20 @@ from hashmal_lib.gui_utils import AmountEdit, floated_buttons, Separator, monosp
 def make_plugin():
     return Plugin(Pycoin, category=Category.Key)
 
+def from_hwif(s):
+    """Deserialize an extended key.
+
+    pycoin is imported here so that it is only loaded when a key is used.
+    """
+    from pycoin.key.BIP32Node import BIP32Node
+    return BIP32Node.from_hwif(s)
+
 class ExtKeyItem(Item):
     name = 'Extended Key'
     @classmethod
     def coerce_item(cls, data):
         def coerce_base58(v):
-            key = BIP32Node.from_hwif(v)
+            key = from_hwif(v)
             return key
 
         for i in [coerce_base58]:
@@ -236,7 +242,7 @@ class Pycoin(BaseDock):
         elif txt.startswith('$'):
             return
         try:
-            key = BIP32Node.from_hwif(txt)
+            key = from_hwif(txt)
         except Exception as e:
             self.invalid_key_label.setVisible(True)
         else:
@@ -260,7 +266,7 @@ class Pycoin(BaseDock):
             return
 
         try:
-            ext_key = BIP32Node.from_hwif(strkey)
+            ext_key = from_hwif(strkey)
             result = ext_key.subkey_for_path(subkey_path)
         except Exception as e:
             self.invalid_subkey_label.setText(str(e))
@@ -0,0 +1,67 @@
+import unittest
+import os
+
+from bitcoin import base58
+from bitcoin.core import x
+
+from hashmal_plugins.base58_tools import batch, codec
+
+class CodecTest(unittest.TestCase):
+    def test_encode(self):
+        self.assertEqual('', codec.encode(b''))
+        self.assertEqual('111', codec.encode(b'\x00\x00\x00'))
+        self.assertEqual('1BvBMSEYstWetqTFn5Au4m4GFg7xJaNVN2', codec.encode(x('0077bff20c60e522dfaa3350c39b030a5d004e839af415766b')))
+
+    def test_decode(self):
+        self.assertEqual(x('0077bff20c60e522dfaa3350c39b030a5d004e839af415766b'), codec.decode('1BvBMSEYstWetqTFn5Au4m4GFg7xJaNVN2'))
+        self.assertRaises(base58.InvalidBase58Error, codec.decode, '10OIl')
+
+    def test_base58check(self):
+        self.assertEqual('1BvBMSEYstWetqTFn5Au4m4GFg7xJaNVN2', codec.encode_check(x('0077bff20c60e522dfaa3350c39b030a5d004e839a')))
+        self.assertEqual(x('0077bff20c60e522dfaa3350c39b030a5d004e839a'), codec.decode_check('1BvBMSEYstWetqTFn5Au4m4GFg7xJaNVN2'))
+        self.assertRaises(base58.Base58ChecksumError, codec.decode_check, '1BvBMSEYstWetqTFn5Au4m4GFg7xJaNVN3')
+
+    def test_large_payloads(self):
+        for size in [100, 1000, 5000]:
+            payload = b'\x00\x00' + os.urandom(size)
+            encoded = codec.encode(payload)
+            self.assertEqual(base58.encode(payload), encoded)
+            self.assertEqual(payload, codec.decode(encoded))
+
+    def test_division(self):
+        b = (1 << 12000) + 12345
+        a = (b << 11999) + 6789
+        self.assertEqual(divmod(a, b), codec._div2n1n(a, b, b.bit_length()))
+
+class BatchTest(unittest.TestCase):
+    def test_encode_lines(self):
+        lines = ['0077bff20c60e522dfaa3350c39b030a5d004e839a\n', '\n', 'zz\n']
+        results = list(batch.convert_lines(lines, batch.ENCODE, check=True, processes=1))
+        self.assertEqual(2, len(results))
+        self.assertEqual((1, '1BvBMSEYstWetqTFn5Au4m4GFg7xJaNVN2', '00', None), (results[0].line_num, results[0].output,
+                         results[0].version, results[0].error))
+        self.assertEqual(3, results[1].line_num)
+        self.assertIsNot(None, results[1].error)
+
+    def test_decode_lines(self):
+        lines = ['1BvBMSEYstWetqTFn5Au4m4GFg7xJaNVN2', '1BvBMSEYstWetqTFn5Au4m4GFg7xJaNVN3'] * 4
+        results = list(batch.convert_lines(lines, batch.DECODE, check=True, processes=2, chunksize=1))
+        self.assertEqual(8, len(results))
+        self.assertEqual(['0077bff20c60e522dfaa3350c39b030a5d004e839a', None] * 4, [i.output for i in results])
+        self.assertEqual(list(range(1, 9)), [i.line_num for i in results])
+
+        results = list(batch.convert_lines(lines[:1], batch.DECODE, processes=1))
+        self.assertEqual('0077bff20c60e522dfaa3350c39b030a5d004e839af415766b', results[0].output)
+        self.assertIs(None, results[0].version)
+
+    def test_lines_are_read_lazily(self):
+        read = []
+        def lines():
+            for i in range(1000):
+                read.append(i)
+                yield '00'
+        results = batch.convert_lines(lines(), batch.ENCODE, processes=2, chunksize=4)
+        self.assertEqual('1', next(results).output)
+        results.close()
+        # At most twice as many chunks as processes are read ahead.
+        self.assertLessEqual(len(read), 4 * 4 + 1)
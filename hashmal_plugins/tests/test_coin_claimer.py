@@ -1,15 +1,36 @@
 import unittest
+import os
+import shutil
+import struct
+import tempfile
+import threading
 
-from bitcoin.core import x, lx, b2x, b2lx
+from bitcoin.core import x, lx, b2x, b2lx, CBlock, CTransaction, CTxIn, CTxOut
 
-from hashmal_lib.core import Transaction
+from hashmal_lib.core import Transaction, chainparams
 
 from hashmal_plugins.coin_claimer import get_unsigned_outputs
+from hashmal_plugins.coin_claimer.claims import (get_hash_types, deserialize_tx, replace_raw_outputs, output_script_type,
+                                                  format_value)
+from hashmal_plugins import tx_offsets
+from hashmal_plugins.coin_claimer.coin_claimer import decode_raw_tx, decode_key
+from hashmal_plugins.coin_claimer import audit
+from hashmal_plugins.decred_tools.hashmal_decred import DecredPreset
+
+chainparams.add_preset(DecredPreset)
 
 raw_tx_sighash_none = '01000000017f71104801ceb380b2267c5a4f8ae619de4b91c20ea01376045d03f8cce05658010000006b483045022100b7e2cee4d6d795e226dc96175e605b58ac60690413494052efa5d2ac5dec52c102205c9612298b3fa0eff9b4d812c8cfd2f8a235ee112e3e4f368339a4e9ef107963022102d22e0c46e17c1c415eade7ce8d5ea5d3d118c801a5553c71420e77042060acf7ffffffff01c09ee605000000001976a914f243c18ef3315b423b2ee33727e37b5fe318bf7c88ac00000000'
 
 raw_tx_sighash_all = '01000000015a8bbbf3da497f03f8f71d74e624e9c4e38a9d181ce55b822c4dcf2ecb359dd501000000910047304402200a156e3e5617cc1d795dfe0c02a5c7dab3941820f194eabd6107f81f25e0519102204d8c585635e03c9137b239893701dc280e25b162011e6474d0c9297d2650b469014751210208b5b58fd9bf58f1d71682887182e7abd428756264442eec230dd021c193f8d9210245af4f2b1ae21c9310a3211f8d5debb296175e20b3a14b173ff30428e03d502d52aeffffffff0162699800000000001976a9146ea6784cd33733e5d2e4f45fa8c248687ed549d288ac00000000'
 
+# P2WPKH spend whose witness signature is SIGHASH_ALL.
+raw_tx_segwit_sighash_all = '0200000000010111111111111111111111111111111111111111111111111111111111111111110000000000ffffffff02905f010000000000160014222222222222222222222222222222222222222288130000000000001976a914333333333333333333333333333333333333333388ac0209300602010102010101210279be667ef9dcbbac55a06295ce870b07029bfcdb2dce28d959f2815b16f8179800000000'
+
+# The same spend with a SIGHASH_NONE witness signature.
+raw_tx_segwit_sighash_none = raw_tx_segwit_sighash_all.replace('0209300602010102010101', '0209300602010102010102')
+
+raw_decred_tx = '01000000010000000000000000000000000000000000000000000000000000000000000000ffffffff00ffffffff0200f2052a01000000abab434104d64bdfd09eb1c5fe295abdeb1dca4281be988e2da0b6c1c6a59dc226c28624e18175e851c96b973d81b01cc31f047834bc06d6d6edf620d184241a6aed8b63a6ac00e1f50500000000bcbc434104d64bdfd09eb1c5fe295abdeb1dca4281be988e2da0b6c1c6a59dc226c28624e18175e851c96b973d81b01cc31f047834bc06d6d6edf620d184241a6aed8b63a6ac00000000000000000112121212121212121515151534343434070431dc001b0162'
+
 class ClaimerTest(unittest.TestCase):
     def test_get_unsigned_outputs_with_sighash_none(self):
         tx = Transaction.deserialize(x(raw_tx_sighash_none))
@@ -27,3 +48,164 @@ class ClaimerTest(unittest.TestCase):
         tx = Transaction.deserialize(x(rawtx))
         unsigned = get_unsigned_outputs(tx)
         self.assertEqual([1], unsigned)
+
+    def test_get_unsigned_outputs_with_segwit(self):
+        self.assertEqual([], get_unsigned_outputs(Transaction.deserialize(x(raw_tx_segwit_sighash_all))))
+        self.assertEqual([0, 1], get_unsigned_outputs(Transaction.deserialize(x(raw_tx_segwit_sighash_none))))
+
+    def test_get_hash_types(self):
+        sig = '3006020101020101'
+        # OP_0 <sig|SIGHASH_ALL> <sig|SIGHASH_SINGLE|SIGHASH_ANYONECANPAY> <non-signature>
+        script = x('0009' + sig + '01' + '09' + sig + '83' + '03aabbcc')
+        self.assertEqual([0x01, 0x83], get_hash_types(script))
+        # Truncated push.
+        self.assertEqual([0x01], get_hash_types(x('09' + sig + '01' + '09aabb')))
+
+    def test_replace_raw_outputs(self):
+        raw = x(raw_tx_sighash_none)
+        new_raw, unsigned = replace_raw_outputs(raw, '0x' + '11'*20)
+        self.assertEqual([0], unsigned)
+        tx = Transaction.deserialize(raw)
+        tx.vout[0].scriptPubKey = x('76a914' + '11'*20 + '88ac')
+        self.assertEqual(b2x(tx.serialize()), b2x(new_raw))
+
+        raw = x(raw_tx_sighash_all)
+        self.assertEqual((raw, []), replace_raw_outputs(raw, '0x' + '11'*20))
+
+    def test_decode_raw_tx(self):
+        tx, offsets, unsigned = decode_raw_tx(raw_tx_sighash_none)
+        self.assertEqual(b2x(x(raw_tx_sighash_none)), b2x(tx.serialize()))
+        self.assertEqual(len(x(raw_tx_sighash_none)), offsets.end)
+        self.assertEqual([0], unsigned)
+        self.assertEqual((None, None, []), decode_raw_tx('0100'))
+
+    def test_decode_key(self):
+        key = decode_key(raw_tx_sighash_none)
+        self.assertEqual(key, decode_key(raw_tx_sighash_none))
+        chainparams.set_to_preset('Decred')
+        try:
+            self.assertNotEqual(key, decode_key(raw_tx_sighash_none))
+        finally:
+            chainparams.set_to_preset('Bitcoin')
+
+    def test_replace_raw_outputs_with_other_preset(self):
+        # Decred outputs have a script version, so they cannot be spliced as Bitcoin outputs.
+        raw = x(raw_decred_tx)
+        chainparams.set_to_preset('Decred')
+        try:
+            tx, offsets = deserialize_tx(raw)
+            self.assertIs(None, offsets)
+            new_raw, unsigned = replace_raw_outputs(raw, '0x' + '11'*20)
+            self.assertEqual([0, 1], unsigned)
+            for o in unsigned:
+                tx.vout[o].scriptPubKey = x('76a914' + '11'*20 + '88ac')
+            self.assertEqual(b2x(tx.serialize()), b2x(new_raw))
+        finally:
+            chainparams.set_to_preset('Bitcoin')
+
+    def test_output_script_type(self):
+        self.assertEqual('P2PKH', output_script_type(x('76a914' + '00'*20 + '88ac')))
+        self.assertEqual('P2SH', output_script_type(x('a914' + '00'*20 + '87')))
+        self.assertEqual('P2PK', output_script_type(x('21' + '02'*33 + 'ac')))
+        self.assertEqual('Null Data', output_script_type(x('6a0100')))
+        self.assertEqual('Nonstandard', output_script_type(x('51')))
+
+    def test_format_value(self):
+        self.assertEqual('0.97951680', format_value(97951680))
+        self.assertEqual('21.00000001', format_value(2100000001))
+
+class TxOffsetsTest(unittest.TestCase):
+    def test_index_tx(self):
+        raw = x(raw_tx_sighash_none)
+        tx = Transaction.deserialize(raw)
+        offsets = tx_offsets.index_tx(tx)
+        self.assertEqual(len(raw), offsets.end)
+        self.assertEqual(b2x(tx.vin[0].scriptSig), b2x(tx_offsets.get_script(raw, offsets.inputs[0])))
+        self.assertEqual(b2x(tx.vout[0].scriptPubKey), b2x(tx_offsets.get_script(raw, offsets.outputs[0])))
+
+    def test_splice_scripts(self):
+        raw = x(raw_tx_sighash_none)
+        offsets = tx_offsets.index_tx(Transaction.deserialize(raw))
+        new_raw = tx_offsets.splice_scripts(raw, offsets.outputs, {0: b'\x51' * 300})
+        tx = Transaction.deserialize(new_raw)
+        self.assertEqual(b'\x51' * 300, tx.vout[0].scriptPubKey)
+        self.assertEqual(len(raw) - 25 + 300 + 2, len(new_raw))
+
+class AuditTest(unittest.TestCase):
+    def setUp(self):
+        super(AuditTest, self).setUp()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_audit(self):
+        with open(os.path.join(self.directory, 'txs.txt'), 'w') as f:
+            f.write('\n'.join([raw_tx_sighash_none, raw_tx_sighash_all, 'zz']))
+        coinbase = CTransaction([CTxIn(scriptSig=x('0101'))], [CTxOut(1, x('51'))])
+        block = CBlock(vtx=[coinbase, CTransaction.deserialize(x(raw_tx_sighash_none))])
+        with open(os.path.join(self.directory, 'block.dat'), 'wb') as f:
+            f.write(block.serialize())
+
+        results = list(audit.audit([self.directory], processes=1))
+        self.assertEqual(3, len(results))
+        self.assertEqual(os.path.join(self.directory, 'block.dat'), results[0].source)
+        self.assertEqual([0], results[0].unsigned_outputs)
+        self.assertEqual(os.path.join(self.directory, 'txs.txt:1'), results[1].source)
+        self.assertEqual([0], results[1].unsigned_outputs)
+        self.assertIsNot(None, results[2].error)
+
+    def test_audit_block_file(self):
+        coinbase = CTransaction([CTxIn(scriptSig=x('0101'))], [CTxOut(1, x('51'))])
+        blocks = [CBlock(vtx=[coinbase]), CBlock(vtx=[coinbase, CTransaction.deserialize(x(raw_tx_sighash_none))])]
+        with open(os.path.join(self.directory, 'blk00000.dat'), 'wb') as f:
+            for block in blocks:
+                data = block.serialize()
+                f.write(b'\xf9\xbe\xb4\xd9' + struct.pack(b'<I', len(data)) + data)
+            f.write(b'\x00' * 64)
+
+        results = list(audit.audit([self.directory], processes=1))
+        self.assertEqual(1, len(results))
+        self.assertEqual(os.path.join(self.directory, 'blk00000.dat:2'), results[0].source)
+        self.assertEqual([0], results[0].unsigned_outputs)
+
+    def test_audit_concatenated_txs(self):
+        with open(os.path.join(self.directory, 'txs.bin'), 'wb') as f:
+            f.write(x(raw_tx_sighash_all) + x(raw_tx_sighash_none))
+
+        items = list(audit.read_items(self.directory))
+        self.assertEqual([x(raw_tx_sighash_all), x(raw_tx_sighash_none)], [i[1] for i in items])
+
+        results = list(audit.audit([self.directory], processes=1))
+        self.assertEqual(1, len(results))
+        self.assertEqual(os.path.join(self.directory, 'txs.bin:2'), results[0].source)
+        self.assertEqual(b2lx(CTransaction.deserialize(x(raw_tx_sighash_none)).GetHash()), results[0].txid)
+
+    def test_audit_stop(self):
+        with open(os.path.join(self.directory, 'txs.txt'), 'w') as f:
+            f.write('\n'.join([raw_tx_sighash_none] * 4))
+        stop = threading.Event()
+        results = audit.audit([self.directory], processes=1, stop=stop)
+        next(results)
+        stop.set()
+        self.assertEqual([], list(results))
+
+    def test_audit_segwit(self):
+        with open(os.path.join(self.directory, 'txs.txt'), 'w') as f:
+            f.write('\n'.join([raw_tx_segwit_sighash_all, raw_tx_segwit_sighash_none]))
+
+        results = list(audit.audit([self.directory], processes=1))
+        self.assertEqual(1, len(results))
+        self.assertEqual(os.path.join(self.directory, 'txs.txt:2'), results[0].source)
+        self.assertEqual([0, 1], results[0].unsigned_outputs)
+
+    def test_audit_uses_active_preset(self):
+        # A Decred coinbase transaction, which is not reported if it is deserialized with the Decred preset.
+        with open(os.path.join(self.directory, 'txs.txt'), 'w') as f:
+            f.write(raw_decred_tx)
+        chainparams.set_to_preset('Decred')
+        try:
+            self.assertEqual([], list(audit.audit([self.directory], processes=2)))
+        finally:
+            chainparams.set_to_preset('Bitcoin')
+        self.assertIsNot(None, list(audit.audit([self.directory], processes=2))[0].error)
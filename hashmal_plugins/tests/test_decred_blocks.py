@@ -0,0 +1,161 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from bitcoin.core import x, b2x
+from bitcoin.core.serialize import SerializationTruncationError
+
+from hashmal_lib.core import chainparams
+
+from hashmal_plugins.decred_tools.hashmal_decred import DecredPreset, dcr_header_fields
+from hashmal_plugins.decred_tools import blocks, headers
+from hashmal_plugins.decred_tools.header_store import HeaderStore
+from hashmal_plugins.decred_tools.core.blake256 import blake256
+
+chainparams.add_preset(DecredPreset)
+
+raw_tx = x('01000000010000000000000000000000000000000000000000000000000000000000000000ffffffff00ffffffff0200f2052a01000000abab434104d64bdfd09eb1c5fe295abdeb1dca4281be988e2da0b6c1c6a59dc226c28624e18175e851c96b973d81b01cc31f047834bc06d6d6edf620d184241a6aed8b63a6ac00e1f50500000000bcbc434104d64bdfd09eb1c5fe295abdeb1dca4281be988e2da0b6c1c6a59dc226c28624e18175e851c96b973d81b01cc31f047834bc06d6d6edf620d184241a6aed8b63a6ac00000000000000000112121212121212121515151534343434070431dc001b0162')
+
+def make_header(height):
+    values = [1, b'\x11'*32, b'\x22'*32, b'\x33'*32, 0, b'\x00'*6, 0, 0, 0, 0, 0x1d00ffff, 0, height, 0, 0, 0, b'\x00'*36]
+    return blocks.header_struct.pack(*values)
+
+class BlockReaderTest(unittest.TestCase):
+    def setUp(self):
+        super(BlockReaderTest, self).setUp()
+        chainparams.set_to_preset('Decred')
+        f = tempfile.NamedTemporaryFile(delete=False)
+        f.write(make_header(5) + b'\x02' + raw_tx + raw_tx + b'\x01' + raw_tx)
+        f.write(make_header(6) + b'\x00\x00')
+        f.close()
+        self.path = f.name
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_header_size(self):
+        self.assertEqual(180, blocks.header_struct.size)
+
+    def test_read_blocks(self):
+        results = []
+        for block in blocks.read_blocks(self.path):
+            txs = list(block.transactions())
+            stxs = list(block.stake_transactions())
+            results.append((block.header.nHeight, len(txs), len(stxs)))
+            for tx in txs + stxs:
+                self.assertEqual(b2x(raw_tx), b2x(tx.raw()))
+                self.assertEqual(1302123111085380114, tx.deserialize().vin[0].value)
+        self.assertEqual([(5, 2, 1), (6, 0, 0)], results)
+
+    def test_truncated_transaction(self):
+        # The last byte of the transaction's witness script is cut off.
+        tx = blocks.MappedTx(raw_tx, 0, len(raw_tx) - 1)
+        self.assertRaises(SerializationTruncationError, tx.deserialize)
+
+        reader = blocks.MappedReader(raw_tx, 0, 4)
+        self.assertEqual(raw_tx[:2], reader.read(2))
+        self.assertRaises(SerializationTruncationError, reader.read, 3)
+        self.assertEqual(raw_tx[2:4], reader.read())
+
+class Blake256Test(unittest.TestCase):
+    def test_blake256(self):
+        self.assertEqual('716f6e863f744b9ac22c97ec7b76ea5f5908bc5b2f67c61510bfc4751384ea7a', b2x(blake256(b'')))
+        self.assertEqual('0ce8d4ef4dd7cd8d62dfded9d4edb0a774ae6a41929a74da23109e8f11139c87', b2x(blake256(b'\x00')))
+        self.assertEqual('d419bad32d504fb7d44d460c42c5593fe544fa4c135dec31e21bd9abdcc22d41', b2x(blake256(b'\x00'*72)))
+
+class HeaderArrayTest(unittest.TestCase):
+    def setUp(self):
+        super(HeaderArrayTest, self).setUp()
+        self.raw_headers = []
+        prev_hash = b'\x00'*32
+        for height in range(10):
+            values = [1, prev_hash, b'\x22'*32, b'\x33'*32, 0, b'\x00'*6, 0, 0, 0, 0, 0x1d00ffff, 0, height, 0, 0, 0, b'\x00'*36]
+            raw = blocks.header_struct.pack(*values)
+            self.raw_headers.append(raw)
+            prev_hash = blake256(raw) if height != 6 else b'\x00'*32
+
+        f = tempfile.NamedTemporaryFile(delete=False)
+        f.write(b''.join(self.raw_headers))
+        f.close()
+        self.path = f.name
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_header_dtype(self):
+        self.assertEqual(180, headers.header_dtype.itemsize)
+        self.assertEqual([field.attr for field in dcr_header_fields], list(headers.header_dtype.names))
+
+    def test_columns(self):
+        arr = headers.load_headers(self.path)
+        self.assertEqual(10, len(arr))
+        self.assertEqual(list(range(10)), list(arr['nHeight']))
+        self.assertEqual([0x1d00ffff] * 10, list(arr['nBits']))
+
+    def test_header_hashes(self):
+        arr = headers.load_headers(self.path)
+        hashes = headers.header_hashes(arr, chunk_size=3)
+        for raw, h in zip(self.raw_headers, hashes):
+            self.assertEqual(b2x(blake256(raw)), b2x(h.tobytes()))
+
+    def test_validate_chain(self):
+        arr = headers.load_headers(self.path)
+        self.assertEqual([7], list(headers.validate_chain(arr)))
+
+class HeaderStoreTest(unittest.TestCase):
+    def setUp(self):
+        super(HeaderStoreTest, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'headers')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _append_headers(self, store, heights):
+        hashes = []
+        prev_hash = store.tip_hash or b'\x00'*32
+        for height in heights:
+            values = [1, prev_hash, b'\x22'*32, b'\x33'*32, 0, b'\x00'*6, 0, 0, 0, 0, 0x1d00ffff, 0, height, 0, 0, 0, b'\x00'*36]
+            prev_hash = store.append(blocks.header_struct.pack(*values))
+            hashes.append(prev_hash)
+        return hashes
+
+    def test_lookups(self):
+        store = HeaderStore(self.path)
+        hashes = self._append_headers(store, range(100, 110))
+        self.assertEqual(109, store.tip_height)
+        self.assertEqual(105, store.get_header(105).nHeight)
+        self.assertIs(None, store.get_header(99))
+        self.assertEqual(103, store.height_of(hashes[3]))
+        self.assertEqual(hashes[2], store.get_header(103).hashPrevBlock)
+        self.assertEqual(108, store.get_header_by_hash(hashes[8]).nHeight)
+        store.close()
+
+    def test_append_must_extend_tip(self):
+        store = HeaderStore(self.path)
+        self._append_headers(store, range(5))
+        raw = store.get_raw_header(3)
+        self.assertRaises(ValueError, store.append, raw)
+        store.close()
+
+    def test_append_must_follow_tip_height(self):
+        store = HeaderStore(self.path)
+        self._append_headers(store, range(5))
+        self.assertRaises(ValueError, self._append_headers, store, [7])
+        self.assertEqual(5, len(store))
+        self.assertIs(None, store.get_header(7))
+        store.close()
+
+    def test_reopen(self):
+        store = HeaderStore(self.path)
+        hashes = self._append_headers(store, range(5))
+        store.close()
+
+        store = HeaderStore(self.path)
+        self.assertEqual(5, len(store))
+        self.assertEqual(hashes[-1], store.tip_hash)
+        self.assertEqual(2, store.height_of(hashes[2]))
+        self._append_headers(store, [5])
+        self.assertEqual(5, store.tip_height)
+        store.close()
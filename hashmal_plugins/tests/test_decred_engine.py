@@ -0,0 +1,303 @@
+import unittest
+
+from bitcoin.core import x, b2x
+
+from hashmal_lib.core import chainparams
+from hashmal_lib.core.transaction import Transaction
+
+from hashmal_plugins.decred_tools.hashmal_decred import DecredPreset
+from hashmal_plugins.decred_tools.core import txhash, wire
+from hashmal_plugins.decred_tools.core.opcodes import LazyMapping, LazySequence, op_names, ops_by_name
+from hashmal_plugins.decred_tools.core.stack import (DecredEngine, DecredExecution, StackTrace, DecredTxCache, SigCache, to_decred_tx,
+            verify_transaction, verify_many, parse_script, ParsedScriptCache, FileStackTrace, LIMIT_STEPS, LIMIT_TRACE_BYTES)
+
+chainparams.add_preset(DecredPreset)
+
+# OP_1 OP_1 OP_ADD OP_2 OP_EQUAL
+script_add = x('5151935287')
+
+class DecredEngineTest(unittest.TestCase):
+    def test_steps_are_executed_lazily(self):
+        engine = DecredEngine(script_add)
+        self.assertEqual(0, len(engine.steps))
+
+        it = iter(engine)
+        step = next(it)
+        self.assertEqual(1, len(engine.steps))
+        self.assertEqual([b'\x01'], [bytes(i) for i in step.stack])
+        self.assertFalse(engine.done)
+
+        remaining = list(it)
+        self.assertEqual(4, len(remaining))
+        self.assertTrue(engine.done)
+        self.assertIs(None, engine.error)
+        self.assertEqual([b'\x01'], [bytes(i) for i in remaining[-1].stack])
+
+    def test_run(self):
+        engine = DecredEngine(script_add)
+        engine.run()
+        self.assertEqual(5, len(engine.steps))
+        # Iterating replays the executed steps.
+        self.assertEqual(5, len(list(engine)))
+
+    def test_steps_use_parsed_ops(self):
+        engine = DecredEngine(script_add)
+        engine.run()
+        self.assertEqual(['OP_1', 'OP_1', 'OP_ADD', 'OP_2', 'OP_EQUAL'], [i[1].name for i in engine.steps])
+
+    def test_max_steps(self):
+        engine = DecredEngine(script_add, max_steps=3)
+        self.assertEqual(3, len(list(engine)))
+        self.assertTrue(engine.done)
+        self.assertEqual(LIMIT_STEPS, engine.limit_reached)
+        self.assertIs(None, engine.error)
+
+    def test_max_trace_bytes(self):
+        engine = DecredEngine(script_add, max_trace_bytes=1)
+        engine.run()
+        self.assertEqual(2, len(engine.steps))
+        self.assertEqual(LIMIT_TRACE_BYTES, engine.limit_reached)
+
+    def test_profile(self):
+        engine = DecredEngine(script_add, profile=True)
+        engine.run()
+        report = dict((i.name, i) for i in engine.profiler.report())
+        self.assertEqual(2, report['OP_1'].count)
+        self.assertEqual(2, report['OP_1'].max_stack_depth)
+        self.assertEqual(1, report['OP_ADD'].count)
+        self.assertEqual(5, sum(i.count for i in report.values()))
+        self.assertIs(None, DecredEngine(script_add).profiler)
+
+    def test_trace_file(self):
+        engine = DecredEngine(script_add, trace_file=True)
+        engine.run()
+        self.assertIsInstance(engine.steps, FileStackTrace)
+        self.assertEqual(5, len(engine.steps))
+        self.assertEqual([b'\x01', b'\x01'], [bytes(i) for i in engine.steps[1].stack])
+        self.assertIs(None, engine.limit_reached)
+        engine.close()
+
+    def test_stack_manipulation_steps(self):
+        # OP_1 OP_2 OP_3 OP_SWAP OP_ROT OP_DUP OP_2 OP_ROLL OP_DROP
+        engine = DecredEngine(x('5152537c7b76527a75'))
+        stacks = [[bytes(i) for i in step.stack] for step in engine]
+        self.assertEqual([[b'\x01'], [b'\x01', b'\x02'], [b'\x01', b'\x02', b'\x03'],
+                          [b'\x01', b'\x03', b'\x02'], [b'\x03', b'\x02', b'\x01'],
+                          [b'\x03', b'\x02', b'\x01', b'\x01'], [b'\x03', b'\x02', b'\x01', b'\x01', b'\x02'],
+                          [b'\x03', b'\x01', b'\x01', b'\x02'], [b'\x03', b'\x01', b'\x01']], stacks)
+        # OP_DUP only pushes an item.
+        self.assertEqual((0, [b'\x01']), engine.steps.deltas[5][:2])
+
+    def test_preset_engine_class(self):
+        self.assertIs(DecredEngine, DecredPreset.script_engine_cls)
+        engine = DecredPreset.script_engine_cls(script_add)
+        self.assertIsInstance(engine, DecredPreset.script_engine_cls)
+
+class OpcodeTableTest(unittest.TestCase):
+    def test_tables(self):
+        self.assertEqual('OP_ADD', op_names[0x93])
+        self.assertEqual(0x93, ops_by_name['OP_ADD'])
+
+    def test_lazy_mapping(self):
+        loads = []
+        d = LazyMapping(lambda: loads.append(1) or {1: 'a'})
+        self.assertEqual([], loads)
+        self.assertIn(1, d)
+        self.assertEqual('a', d.get(1))
+        self.assertEqual({1: 'a'}, dict(d))
+        self.assertEqual([1], loads)
+
+    def test_lazy_sequence(self):
+        seq = LazySequence(lambda: [3, 4])
+        self.assertEqual([3, 4], list(seq))
+        self.assertIn(4, seq)
+        self.assertEqual(1, seq.index(4))
+
+    def test_tables_are_not_builtin_containers(self):
+        # Consumers that read builtin storage directly would see empty tables.
+        self.assertNotIsInstance(op_names, dict)
+        self.assertEqual('OP_ADD', dict(op_names)[0x93])
+
+class ParseScriptTest(unittest.TestCase):
+    def test_parse_script(self):
+        # OP_1 <abcd> OP_PUSHDATA1 <010203> OP_PUSHDATA2 <ff> OP_ADD
+        ops = parse_script(x('5102abcd4c030102034d0100ff93'))
+        self.assertEqual([0x51, 0x02, 0x4c, 0x4d, 0x93], [i.op.value for i in ops])
+        self.assertEqual([b'', b'\xab\xcd', b'\x01\x02\x03', b'\xff', b''], [i.data for i in ops])
+
+    def test_malformed_script(self):
+        self.assertIs(None, parse_script(x('02ab')))
+        self.assertIs(None, parse_script(x('4d01')))
+
+    def test_cache(self):
+        cache = ParsedScriptCache(max_size=1)
+        ops = cache.get(script_add)
+        self.assertIs(ops, cache.get(bytes(script_add)))
+        cache.get(x('51'))
+        self.assertEqual(1, len(cache.scripts))
+
+class DecredExecutionTest(unittest.TestCase):
+    def test_evaluate(self):
+        result = DecredExecution().evaluate(script_add)
+        self.assertTrue(result.success)
+        self.assertIs(None, result.error)
+        self.assertEqual([b'\x01'], [bytes(i) for i in result.stack])
+        self.assertEqual(5, result.op_count)
+
+    def test_evaluate_long_flags(self):
+        # A flag mask can be a long on Python 2.
+        self.assertTrue(DecredExecution().evaluate(script_add, flags=long(1)).success)
+        self.assertTrue(DecredExecution().evaluate(script_add, flags=()).success)
+
+    def test_evaluate_failing_script(self):
+        # OP_1 OP_2 OP_EQUAL
+        result = DecredExecution().evaluate(x('515287'))
+        self.assertFalse(result.success)
+        self.assertIsNot(None, result.error)
+        self.assertEqual(3, result.op_count)
+
+class StackTraceTest(unittest.TestCase):
+    def test_rebuild_steps(self):
+        stacks = [[], [b'a'], [b'a', b'b'], [b'a', b'b', b'c'], [b'a', b'c'], [b'd', b'c'], [b'd'], [b'd', b'd']]
+        trace = StackTrace(checkpoint_interval=3)
+        for i, stack in enumerate(stacks):
+            trace.append(list(stack), i)
+
+        self.assertEqual(len(stacks), len(trace))
+        self.assertEqual(stacks, [i.stack for i in trace])
+        for i in [5, 1, 7, 0, 6, 2, -1]:
+            self.assertEqual(stacks[i], trace[i].stack)
+        self.assertEqual(4, trace[4][1])
+        # Only the changed items are stored.
+        self.assertEqual((2, [b'c'], 4), trace.deltas[4])
+        self.assertEqual(11, trace.nbytes)
+
+    def test_append_delta(self):
+        trace = StackTrace(checkpoint_interval=2)
+        trace.append_delta(0, [b'a', b'b'], 0)
+        trace.append_delta(1, [b'c'], 1)
+        trace.append_delta(2, [], 2)
+        self.assertEqual([[b'a', b'b'], [b'a', b'c'], []], [i.stack for i in trace])
+        self.assertEqual([b'a', b'c'], trace[1].stack)
+        self.assertEqual([], trace.last_stack)
+
+    def test_file_trace(self):
+        stacks = [[], [b'a'], [b'a', b'b'], [b'a', b'c'], [b'd']]
+        trace = FileStackTrace(checkpoint_interval=2)
+        for i, stack in enumerate(stacks):
+            trace.append(list(stack), i)
+
+        self.assertEqual(stacks, [i.stack for i in trace])
+        for i in [3, 0, 4, 1]:
+            self.assertEqual(stacks[i], trace[i].stack)
+        trace.close()
+
+class VerifyTest(unittest.TestCase):
+    def setUp(self):
+        super(VerifyTest, self).setUp()
+        chainparams.set_to_preset('Decred')
+        self.raw_tx = x('01000000010000000000000000000000000000000000000000000000000000000000000000ffffffff00ffffffff0200f2052a01000000abab434104d64bdfd09eb1c5fe295abdeb1dca4281be988e2da0b6c1c6a59dc226c28624e18175e851c96b973d81b01cc31f047834bc06d6d6edf620d184241a6aed8b63a6ac00e1f50500000000bcbc434104d64bdfd09eb1c5fe295abdeb1dca4281be988e2da0b6c1c6a59dc226c28624e18175e851c96b973d81b01cc31f047834bc06d6d6edf620d184241a6aed8b63a6ac00000000000000000112121212121212121515151534343434070431dc001b0162')
+
+    def test_verify_transaction(self):
+        tx = Transaction.deserialize(self.raw_tx)
+        result = verify_transaction(tx, [x('51')])[0]
+        self.assertEqual((0, True, None), result)
+
+        result = verify_transaction(tx, [x('00')])[0]
+        self.assertFalse(result.valid)
+        self.assertIsNot(None, result.error)
+
+        self.assertRaises(ValueError, verify_transaction, tx, [])
+
+    def test_verify_many(self):
+        tx = Transaction.deserialize(self.raw_tx)
+        jobs = [(tx, [x('51')]), (self.raw_tx, [x('00')])] * 3
+        results = verify_many(jobs, processes=2, chunksize=1)
+        self.assertEqual([True, False] * 3, [i[0].valid for i in results])
+
+    def test_verify_many_reports_bad_transactions(self):
+        tx = Transaction.deserialize(self.raw_tx)
+        jobs = [(tx, [x('51')]), (self.raw_tx[:20], [x('51')]), (tx, []), (self.raw_tx, [x('51')])]
+        results = verify_many(jobs, processes=2, chunksize=1)
+        self.assertEqual(4, len(results))
+        self.assertEqual((0, True, None), results[0][0])
+        self.assertEqual((0, True, None), results[3][0])
+        for result in results[1:3]:
+            self.assertEqual(1, len(result))
+            self.assertIs(None, result[0].in_idx)
+            self.assertFalse(result[0].valid)
+            self.assertTrue(result[0].error)
+
+class DecredTxCacheTest(unittest.TestCase):
+    def setUp(self):
+        super(DecredTxCacheTest, self).setUp()
+        chainparams.set_to_preset('Decred')
+        self.raw_tx = x('01000000010000000000000000000000000000000000000000000000000000000000000000ffffffff00ffffffff0200f2052a01000000abab434104d64bdfd09eb1c5fe295abdeb1dca4281be988e2da0b6c1c6a59dc226c28624e18175e851c96b973d81b01cc31f047834bc06d6d6edf620d184241a6aed8b63a6ac00e1f50500000000bcbc434104d64bdfd09eb1c5fe295abdeb1dca4281be988e2da0b6c1c6a59dc226c28624e18175e851c96b973d81b01cc31f047834bc06d6d6edf620d184241a6aed8b63a6ac00000000000000000112121212121212121515151534343434070431dc001b0162')
+
+    def test_to_decred_tx(self):
+        tx = Transaction.deserialize(self.raw_tx)
+        self.assertEqual(b2x(self.raw_tx), b2x(to_decred_tx(tx).serialize()))
+
+    def test_cache(self):
+        cache = DecredTxCache(max_size=1)
+        tx = Transaction.deserialize(self.raw_tx)
+        dtx = cache.get(tx)
+        self.assertIs(dtx, cache.get(Transaction.deserialize(self.raw_tx)))
+
+        tx.nLockTime = 1
+        dtx = cache.get(tx)
+        self.assertEqual(1, dtx.locktime)
+        self.assertEqual(1, len(cache.txs))
+        # Transactions are keyed by their memoized hash.
+        self.assertEqual([txhash.full_hash(tx)], list(cache.txs))
+
+        tx.vin[0].scriptSig = x('51')
+        self.assertEqual(x('51'), cache.get(tx).txins[0].sig_script)
+
+        # An output appended after a pop may reuse the id of the removed one.
+        tx.vout.append(wire.DecredTxOut(nValue=2, scriptPubKey=tx.vout.pop().scriptPubKey, kwfields={'version': 0}))
+        self.assertEqual(2, cache.get(tx).txouts[-1].value)
+
+class RecordingSigCache(SigCache):
+    """SigCache that records the arguments of its last lookup."""
+    def exists(self, sig_hash, sig, pubkey):
+        self.last_lookup = (sig_hash, sig, pubkey)
+        return super(RecordingSigCache, self).exists(sig_hash, sig, pubkey)
+
+class SigCacheTest(unittest.TestCase):
+    def test_engine_uses_cache(self):
+        chainparams.set_to_preset('Decred')
+        tx = Transaction.deserialize(x('01000000010000000000000000000000000000000000000000000000000000000000000000ffffffff00ffffffff0200f2052a01000000abab434104d64bdfd09eb1c5fe295abdeb1dca4281be988e2da0b6c1c6a59dc226c28624e18175e851c96b973d81b01cc31f047834bc06d6d6edf620d184241a6aed8b63a6ac00e1f50500000000bcbc434104d64bdfd09eb1c5fe295abdeb1dca4281be988e2da0b6c1c6a59dc226c28624e18175e851c96b973d81b01cc31f047834bc06d6d6edf620d184241a6aed8b63a6ac00000000000000000112121212121212121515151534343434070431dc001b0162'))
+        # <sig (r=1, s=1, SIGHASH_ALL)> <generator point>
+        tx.vin[0].scriptSig = x('093006020101020101012102') + x('79be667ef9dcbbac55a06295ce870b07029bfcdb2dce28d959f2815b16f81798')
+        # OP_CHECKSIG
+        pk_script = x('ac')
+        cache = RecordingSigCache()
+
+        engine = DecredEngine(pk_script, tx, 0, sig_cache=cache)
+        engine.run()
+        self.assertEqual({'hits': 0, 'misses': 1, 'entries': 0}, cache.stats())
+
+        # Once the signature is cached, verifying the same CHECKSIG again hits the cache.
+        cache.add(*cache.last_lookup)
+        engine = DecredEngine(pk_script, tx, 0, sig_cache=cache)
+        engine.run()
+        self.assertEqual(1, cache.stats()['hits'])
+        self.assertEqual([b'\x01'], [bytes(i) for i in engine.steps[-1].stack])
+
+    def test_lookups(self):
+        cache = SigCache(max_entries=2)
+        self.assertFalse(cache.exists(b'\x01'*32, b'sig1', b'pubkey'))
+        cache.add(b'\x01'*32, b'sig1', b'pubkey')
+        self.assertTrue(cache.exists(b'\x01'*32, b'sig1', b'pubkey'))
+        self.assertFalse(cache.exists(b'\x02'*32, b'sig1', b'pubkey'))
+        self.assertEqual({'hits': 1, 'misses': 2, 'entries': 1}, cache.stats())
+
+    def test_least_recently_used_is_evicted(self):
+        cache = SigCache(max_entries=2)
+        cache.add(b'\x01'*32, b'sig1', b'pubkey')
+        cache.add(b'\x02'*32, b'sig2', b'pubkey')
+        self.assertTrue(cache.exists(b'\x01'*32, b'sig1', b'pubkey'))
+        cache.add(b'\x03'*32, b'sig3', b'pubkey')
+        self.assertTrue(cache.exists(b'\x01'*32, b'sig1', b'pubkey'))
+        self.assertFalse(cache.exists(b'\x02'*32, b'sig2', b'pubkey'))
@@ -1,14 +1,16 @@
 import unittest
 from collections import namedtuple
 
-from bitcoin.core import x, b2x
+from bitcoin.core import x, b2x, b2lx
 
 from hashmal_lib.core import chainparams
 from hashmal_lib.core.transaction import Transaction
 from hashmal_lib import gui_utils
 
 from hashmal_plugins.decred_tools.hashmal_decred import (DecredPreset, dcr_header_fields, dcr_tx_fields,
-            dcr_prevout_fields, dcr_txin_fields, dcr_txout_fields)
+            dcr_prevout_fields, dcr_txin_fields, dcr_txout_fields, deserialize_tx, deserialize_many)
+from hashmal_plugins.decred_tools.core import wire, txhash
+from hashmal_plugins.decred_tools.core.blake256 import blake256
 
 chainparams.add_preset(DecredPreset)
 
@@ -49,6 +51,117 @@ class TransactionTest(unittest.TestCase):
 
         self.assertEqual(b2x(raw_tx), b2x(tx.serialize()))
 
+    def test_prefix_and_witness_serialization(self):
+        raw_tx = x('01000000010000000000000000000000000000000000000000000000000000000000000000ffffffff00ffffffff0200f2052a01000000abab434104d64bdfd09eb1c5fe295abdeb1dca4281be988e2da0b6c1c6a59dc226c28624e18175e851c96b973d81b01cc31f047834bc06d6d6edf620d184241a6aed8b63a6ac00e1f50500000000bcbc434104d64bdfd09eb1c5fe295abdeb1dca4281be988e2da0b6c1c6a59dc226c28624e18175e851c96b973d81b01cc31f047834bc06d6d6edf620d184241a6aed8b63a6ac00000000000000000112121212121212121515151534343434070431dc001b0162')
+        raw_prefix = x('01000100010000000000000000000000000000000000000000000000000000000000000000ffffffff00ffffffff0200f2052a01000000abab434104d64bdfd09eb1c5fe295abdeb1dca4281be988e2da0b6c1c6a59dc226c28624e18175e851c96b973d81b01cc31f047834bc06d6d6edf620d184241a6aed8b63a6ac00e1f50500000000bcbc434104d64bdfd09eb1c5fe295abdeb1dca4281be988e2da0b6c1c6a59dc226c28624e18175e851c96b973d81b01cc31f047834bc06d6d6edf620d184241a6aed8b63a6ac0000000000000000')
+        raw_witness = x('010002000112121212121212121515151534343434070431dc001b0162')
+        tx = Transaction.deserialize(raw_tx)
+        self.assertEqual(b2x(raw_prefix), b2x(wire.serialize_tx(tx, wire.TX_SER_NO_WITNESS)))
+        self.assertEqual(b2x(raw_witness), b2x(wire.serialize_tx(tx, wire.TX_SER_ONLY_WITNESS)))
+
+        prefix_tx = Transaction.deserialize(raw_prefix)
+        self.assertEqual(1, prefix_tx.nVersion)
+        self.assertEqual(2, len(prefix_tx.vout))
+        self.assertEqual(0, prefix_tx.vin[0].value)
+        self.assertEqual(b2x(raw_prefix), b2x(wire.serialize_tx(prefix_tx, wire.TX_SER_NO_WITNESS)))
+
+        witness_tx = Transaction.deserialize(raw_witness)
+        self.assertEqual(0, len(witness_tx.vout))
+        self.assertEqual(1302123111085380114, witness_tx.vin[0].value)
+        self.assertEqual(x('0431dc001b0162'), witness_tx.vin[0].scriptSig)
+
+    def test_lazy_witness_deserialization(self):
+        raw_tx = x('01000000010000000000000000000000000000000000000000000000000000000000000000ffffffff00ffffffff0200f2052a01000000abab434104d64bdfd09eb1c5fe295abdeb1dca4281be988e2da0b6c1c6a59dc226c28624e18175e851c96b973d81b01cc31f047834bc06d6d6edf620d184241a6aed8b63a6ac00e1f50500000000bcbc434104d64bdfd09eb1c5fe295abdeb1dca4281be988e2da0b6c1c6a59dc226c28624e18175e851c96b973d81b01cc31f047834bc06d6d6edf620d184241a6aed8b63a6ac00000000000000000112121212121212121515151534343434070431dc001b0162')
+        tx = deserialize_tx(raw_tx, lazy_witness=True)
+
+        self.assertIsNot(None, wire.pending_witness(tx))
+        self.assertEqual(5000000000, tx.vout[0].nValue)
+        self.assertEqual(b2x(raw_tx), b2x(tx.serialize()))
+        self.assertIsNot(None, wire.pending_witness(tx))
+
+        txin = tx.vin[0]
+        self.assertEqual(353703189, txin.block_height)
+        self.assertIs(None, wire.pending_witness(tx))
+        self.assertEqual(x('0431dc001b0162'), txin.scriptSig)
+        self.assertEqual(b2x(raw_tx), b2x(tx.serialize()))
+
+    def test_deserialize_many(self):
+        raw_tx = x('01000000010000000000000000000000000000000000000000000000000000000000000000ffffffff00ffffffff0200f2052a01000000abab434104d64bdfd09eb1c5fe295abdeb1dca4281be988e2da0b6c1c6a59dc226c28624e18175e851c96b973d81b01cc31f047834bc06d6d6edf620d184241a6aed8b63a6ac00e1f50500000000bcbc434104d64bdfd09eb1c5fe295abdeb1dca4281be988e2da0b6c1c6a59dc226c28624e18175e851c96b973d81b01cc31f047834bc06d6d6edf620d184241a6aed8b63a6ac00000000000000000112121212121212121515151534343434070431dc001b0162')
+        raw_txs = [raw_tx] * 10
+
+        txs = deserialize_many(raw_txs, processes=1)
+        self.assertEqual(10, len(txs))
+        self.assertEqual(b2x(raw_tx), b2x(txs[0].serialize()))
+
+        txs = deserialize_many(raw_txs, processes=2, chunksize=3)
+        self.assertEqual(10, len(txs))
+        self.assertEqual(353703189, txs[-1].vin[0].block_height)
+        self.assertEqual(b2x(raw_tx), b2x(txs[-1].serialize()))
+
+        txs = deserialize_many(raw_txs, processes=1, lazy_witness=True)
+        self.assertIsNot(None, wire.pending_witness(txs[0]))
+        self.assertEqual(353703189, txs[0].vin[0].block_height)
+        self.assertIs(None, wire.pending_witness(Transaction.deserialize(raw_tx)))
+
+        summaries = deserialize_many(raw_txs, summaries=True, processes=2, chunksize=3)
+        self.assertEqual(10, len(summaries))
+        summary = summaries[-1]
+        self.assertEqual((1, 1, 2), (summary.nVersion, summary.num_inputs, summary.num_outputs))
+        self.assertEqual(5100000000, summary.value_out)
+        self.assertEqual(len(raw_tx), summary.size)
+
+    def test_transaction_hashes(self):
+        raw_tx = x('01000000010000000000000000000000000000000000000000000000000000000000000000ffffffff00ffffffff0200f2052a01000000abab434104d64bdfd09eb1c5fe295abdeb1dca4281be988e2da0b6c1c6a59dc226c28624e18175e851c96b973d81b01cc31f047834bc06d6d6edf620d184241a6aed8b63a6ac00e1f50500000000bcbc434104d64bdfd09eb1c5fe295abdeb1dca4281be988e2da0b6c1c6a59dc226c28624e18175e851c96b973d81b01cc31f047834bc06d6d6edf620d184241a6aed8b63a6ac00000000000000000112121212121212121515151534343434070431dc001b0162')
+        tx = Transaction.deserialize(raw_tx)
+        prefix_hash = txhash.prefix_hash(tx)
+        witness_hash = txhash.witness_hash(tx)
+        self.assertEqual(b2x(blake256(wire.prefix_serialization(raw_tx))), b2x(prefix_hash))
+        self.assertEqual(b2x(blake256(prefix_hash + witness_hash)), b2x(txhash.full_hash(tx)))
+        self.assertEqual(txhash.txid(tx), deserialize_many([raw_tx], summaries=True, processes=1)[0].txid)
+
+        summary = deserialize_many([raw_tx], summaries=True, processes=1)[0]
+        self.assertEqual(b2lx(witness_hash), summary.witness_hash)
+
+        # Editing the witness only rehashes the witness.
+        tx.vin[0].scriptSig = x('51')
+        self.assertIs(prefix_hash, txhash.prefix_hash(tx))
+        self.assertNotEqual(witness_hash, txhash.witness_hash(tx))
+        self.assertEqual(b2x(blake256(wire.serialize_tx(tx, wire.TX_SER_ONLY_WITNESS))), b2x(txhash.witness_hash(tx)))
+
+    def test_transaction_hashes_follow_edits(self):
+        raw_tx = x('01000000010000000000000000000000000000000000000000000000000000000000000000ffffffff00ffffffff0200f2052a01000000abab434104d64bdfd09eb1c5fe295abdeb1dca4281be988e2da0b6c1c6a59dc226c28624e18175e851c96b973d81b01cc31f047834bc06d6d6edf620d184241a6aed8b63a6ac00e1f50500000000bcbc434104d64bdfd09eb1c5fe295abdeb1dca4281be988e2da0b6c1c6a59dc226c28624e18175e851c96b973d81b01cc31f047834bc06d6d6edf620d184241a6aed8b63a6ac00000000000000000112121212121212121515151534343434070431dc001b0162')
+        tx = Transaction.deserialize(raw_tx)
+        witness_hash = txhash.witness_hash(tx)
+
+        def expected_prefix_hash():
+            return b2x(blake256(wire.serialize_tx(tx, wire.TX_SER_NO_WITNESS)))
+
+        edits = [
+            lambda: setattr(tx.vin[0].prevout, 'n', 1),
+            lambda: setattr(tx.vin[0], 'nSequence', 5),
+            lambda: setattr(tx.vout[1], 'nValue', 1),
+            lambda: setattr(tx, 'nLockTime', 100),
+            lambda: tx.vout.pop(),
+            # The new output may be given the id of the removed one.
+            lambda: tx.vout.append(wire.DecredTxOut(nValue=2, scriptPubKey=tx.vout.pop().scriptPubKey,
+                                                    kwfields={'version': 0})),
+        ]
+        for edit in edits:
+            prefix_hash = txhash.prefix_hash(tx)
+            edit()
+            self.assertNotEqual(prefix_hash, txhash.prefix_hash(tx))
+            self.assertEqual(expected_prefix_hash(), b2x(txhash.prefix_hash(tx)))
+        self.assertIs(witness_hash, txhash.witness_hash(tx))
+
+        # A replaced prevout is tracked too.
+        tx.vin[0].prevout = wire.DecredOutPoint(hash=b'\x01'*32, n=0, kwfields={'tree': 0})
+        self.assertEqual(expected_prefix_hash(), b2x(txhash.prefix_hash(tx)))
+        tx.vin[0].prevout.tree = 1
+        self.assertEqual(expected_prefix_hash(), b2x(txhash.prefix_hash(tx)))
+
+        tx.vout[0].nValue = 1
+        self.assertNotEqual(prefix_hash, txhash.prefix_hash(tx))
+
 LabelTest = namedtuple('LabelTest', ('attr', 'label'))
 
 class ViewLabelTest(unittest.TestCase):
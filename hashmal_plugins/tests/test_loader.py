@@ -0,0 +1,27 @@
+import unittest
+import sys
+
+from hashmal_plugins import loader
+
+class LoaderTest(unittest.TestCase):
+    def test_entry_points(self):
+        for name in loader.descriptors.keys():
+            attr = 'make_' + name.lower().replace(' ', '_')
+            self.assertTrue(callable(getattr(loader, attr)))
+
+    def test_load_module(self):
+        module = loader.load_module('Decred')
+        self.assertIs(sys.modules['hashmal_plugins.decred_tools.hashmal_decred'], module)
+        self.assertEqual(list(loader.descriptors.keys()), [i[0] for i in loader.import_report()])
+
+    def test_import_report(self):
+        # A module that has not been imported yet.
+        sys.modules.pop('colorsys', None)
+        loader.descriptors['Test'] = loader.PluginDescriptor('Test', 'colorsys')
+        try:
+            self.assertIs(None, dict(loader.import_report())['Test'])
+            loader.load_module('Test')
+            self.assertGreaterEqual(dict(loader.import_report())['Test'], 0)
+        finally:
+            del loader.descriptors['Test']
+            loader.import_times.pop('Test', None)
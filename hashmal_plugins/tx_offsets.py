@@ -0,0 +1,99 @@
+"""Byte offsets of the parts of serialized Bitcoin transactions.
+
+An index of where each input script and output lies in a serialized
+transaction lets scripts be read or replaced in the raw bytes without
+reserializing the whole transaction. The index is computed from the
+lengths of a deserialized transaction's scripts, so the raw bytes are
+only parsed once, by the transaction's deserializer.
+"""
+from collections import namedtuple
+
+from bitcoin.core.serialize import VarIntSerializer
+
+# Offsets of an input or output. The script length varint starts at
+# len_start, and the script occupies script_start:end.
+ItemOffsets = namedtuple('ItemOffsets', ('start', 'len_start', 'script_start', 'end'))
+TxOffsets = namedtuple('TxOffsets', ('inputs', 'outputs', 'end'))
+
+def varint_size(n):
+    """Get the number of bytes in the varint encoding of n."""
+    if n < 0xfd:
+        return 1
+    elif n <= 0xffff:
+        return 3
+    elif n <= 0xffffffff:
+        return 5
+    return 9
+
+def _script_item(start, header_size, script):
+    len_start = start + header_size
+    script_start = len_start + varint_size(len(script))
+    return ItemOffsets(start, len_start, script_start, script_start + len(script))
+
+def index_tx(tx, offset=0):
+    """Index the serialization of tx, a transaction with the Bitcoin layout.
+
+    Transactions with witness data are supported. The offsets are only
+    valid for serializations whose varints are minimally encoded, which
+    can be checked by comparing the returned end with the serialization's
+    length.
+
+    Args:
+        tx: Deserialized transaction.
+        offset (int): Offset of the serialized transaction in its buffer.
+    """
+    wit = getattr(tx, 'wit', None)
+    has_witness = wit is not None and not wit.is_null()
+    # Version and the segwit marker and flag.
+    i = offset + 4 + (2 if has_witness else 0)
+
+    inputs = []
+    i += varint_size(len(tx.vin))
+    for txin in tx.vin:
+        # Prevout hash and index precede the script.
+        item = _script_item(i, 36, txin.scriptSig)
+        inputs.append(item)
+        # Sequence follows the script.
+        i = item.end + 4
+
+    outputs = []
+    i += varint_size(len(tx.vout))
+    for txout in tx.vout:
+        # Value precedes the script.
+        item = _script_item(i, 8, txout.scriptPubKey)
+        outputs.append(item)
+        i = item.end
+
+    if has_witness:
+        for txinwit in wit.vtxinwit:
+            stack = txinwit.scriptWitness.stack
+            i += varint_size(len(stack)) + sum(varint_size(len(item)) + len(item) for item in stack)
+    # Locktime.
+    i += 4
+    return TxOffsets(inputs, outputs, i)
+
+def get_script(raw, item):
+    return raw[item.script_start:item.end]
+
+def splice_scripts(raw, items, scripts):
+    """Replace scripts in raw.
+
+    Args:
+        raw (bytes): Serialized transaction.
+        items (list): ItemOffsets of the inputs or outputs whose scripts may be replaced.
+        scripts (dict): New scripts, keyed by index in items.
+
+    Returns:
+        The serialized transaction with the scripts replaced.
+    """
+    parts = []
+    pos = 0
+    for n in sorted(scripts.keys()):
+        item = items[n]
+        script = bytes(scripts[n])
+        parts.append(raw[pos:item.len_start])
+        parts.append(VarIntSerializer.serialize(len(script)))
+        parts.append(script)
+        pos = item.end
+    parts.append(raw[pos:])
+    return b''.join(parts)
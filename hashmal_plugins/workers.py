@@ -0,0 +1,50 @@
+"""Running a function over many items on a pool of worker processes.
+
+Items are sent to workers in chunks, and only a limited number of chunks
+are outstanding at a time, so large inputs are read no faster than their
+results are consumed.
+"""
+from collections import deque
+import itertools
+import multiprocessing
+
+def _run_chunk(func, chunk):
+    return [func(i) for i in chunk]
+
+def imap(func, iterable, processes=None, chunksize=1, window=None, initializer=None, initargs=()):
+    """Yield func(item) for each item in iterable, in order.
+
+    Args:
+        func (function): Module-level function to call on each item.
+        iterable (iterable): Items. It is read lazily.
+        processes (int): Number of worker processes. Defaults to the number of CPUs.
+            If 1, items are handled in the current process and initializer is not called.
+        chunksize (int): Number of items sent to a worker at a time.
+        window (int): Maximum number of chunks that have been sent to workers
+            but not yet yielded. Defaults to twice the number of processes.
+        initializer (function): Function called with initargs in each worker when it starts.
+    """
+    if processes == 1:
+        for item in iterable:
+            yield func(item)
+        return
+
+    processes = processes or multiprocessing.cpu_count()
+    window = window or 2 * processes
+    items = iter(iterable)
+    pool = multiprocessing.Pool(processes, initializer, initargs)
+    try:
+        pending = deque()
+        while True:
+            while len(pending) < window:
+                chunk = list(itertools.islice(items, chunksize))
+                if not chunk:
+                    break
+                pending.append(pool.apply_async(_run_chunk, (func, chunk)))
+            if not pending:
+                break
+            for result in pending.popleft().get():
+                yield result
+    finally:
+        pool.terminate()
+        pool.join()